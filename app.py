@@ -1,25 +1,46 @@
 # app.py
 """
 BTC/ETH 市场情绪监控器（简洁版）
-- 自动检测频率固定为 180 分钟（3 小时）
+- 自动检测默认每 180 分钟（3 小时，可配置）；另有分钟级价格轮询，价格剧烈波动时提前触发检测
 - 邮件标题保持简洁，邮件内容详细（价格、关键链上指标、评分与建议）
 - 通知：Gmail SMTP + Server酱 (ServerChan)
 - 链上/机构指标：可选使用 Glassnode（将 GLASSNODE_API_KEY 放入 Secrets）
 """
 
 import os
+import sys
 import json
+import hashlib
+import mmap
+import struct
 import time
+import math
 import statistics
+import argparse
 import atexit
+import bisect
+import itertools
+import queue
+import random
+import threading
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, TimeoutError as FuturesTimeout
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
 from typing import Dict, Any, List
 
 import streamlit as st
+try:
+    import websocket  # websocket-client：可选，启用交易所 WebSocket 实时价格
+except ImportError:
+    websocket = None
 from apscheduler.schedulers.background import BackgroundScheduler
 from email.mime.text import MIMEText
 from email.header import Header
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
 import smtplib
 
 # --------------------
@@ -34,25 +55,107 @@ def get_secret(key, default=None):
         pass
     return os.getenv(key, default)
 
+def get_bool_secret(key, default=False) -> bool:
+    """开关类配置：Secrets 中的布尔值或 "1" / "true" / "yes" / "on"（不区分大小写）为开启。"""
+    v = get_secret(key, None)
+    if v is None:
+        return default
+    return str(v).strip().lower() in ("1", "true", "yes", "on")
+
 # 必要项（不写到代码中）
 GMAIL_USER = get_secret("GMAIL_USER")            # 发件 Gmail（例如 your@gmail.com）
 GMAIL_APP_PASS = get_secret("GMAIL_APP_PASS")    # Gmail App Password (建议使用 App Password)
 ALERT_EMAIL_TO = get_secret("ALERT_EMAIL_TO")    # 收件邮箱（例如 alert@you.com）
 SERVERCHAN_SENDKEY = get_secret("SERVERCHAN_SENDKEY")  # Server酱 SendKey (SCTxxxx)
 
+# 摘要模式：同一轮的多个告警合并为一封邮件 / 一条微信推送（节省 Server酱 每日额度）
+ALERT_DIGEST = get_bool_secret("ALERT_DIGEST", True)
+
 # 可选：Glassnode（提高链上指标质量）
 GLASSNODE_API_KEY = get_secret("GLASSNODE_API_KEY", None)
 
-# 固定的检测间隔（分钟）——3 小时
-FIXED_INTERVAL_MIN = 180
+# 完整检测（价格 + 链上指标 + 评分 + 通知）的间隔（分钟），默认 3 小时
+CHECK_INTERVAL_MIN = float(get_secret("CHECK_INTERVAL_MIN", 180))
+
+# 快速价格轮询（秒，0 表示关闭）：只拉一次批量价格；自上次完整检测以来任一资产涨跌超过
+# PRICE_MOVE_TRIGGER_PCT 时提前触发完整检测，两次触发至少间隔 MIN_TRIGGER_GAP_MIN 分钟
+PRICE_POLL_SEC = float(get_secret("PRICE_POLL_SEC", 60))
+PRICE_MOVE_TRIGGER_PCT = float(get_secret("PRICE_MOVE_TRIGGER_PCT", 3.0))
+MIN_TRIGGER_GAP_MIN = float(get_secret("MIN_TRIGGER_GAP_MIN", 30))
+
+# 随仓库部署的配置文件（metrics.json / score_config.json）默认与 app.py 同目录，不依赖启动时的工作目录
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 评分参数文件（由 `python app.py optimize` 生成）：权重与阈值，缺失时使用代码中的默认值
+SCORE_CONFIG_PATH = get_secret("SCORE_CONFIG_PATH", os.path.join(APP_DIR, "score_config.json"))
+
+def load_score_config(path=SCORE_CONFIG_PATH) -> Dict[str, Any]:
+    try:
+        with open(path, "r") as f:
+            cfg = json.load(f)
+        return cfg if isinstance(cfg, dict) else {}
+    except Exception:
+        return {}
+
+SCORE_CONFIG = load_score_config()
+
+# 指标注册表（METRICS_CONFIG_PATH 指向的 JSON 文件，默认为与 app.py 同目录的 metrics.json）：
+# 每项声明指标名、抓取方式（fetcher）、权重与符号、分辨率和缓存 TTL；抓取计划、历史存储与评分均由注册表驱动
+# - fetcher = glassnode：直接取 Glassnode 指标 path 的最新值（多资产合并为 bulk 请求）
+# - fetcher = glassnode_pct_change：原始序列 path 同步到本地序列 series，取 window_days 天变化率；
+#   可选 window_secret 指定一个 Secrets 键，用于覆盖 window_days
+# - fetcher = whale_count：巨鲸转账计数，thresholds 为各资产单笔阈值（币数量）
+METRICS_CONFIG_PATH = get_secret("METRICS_CONFIG_PATH", os.path.join(APP_DIR, "metrics.json"))
+METRIC_FETCHER_KINDS = ("glassnode", "glassnode_pct_change", "whale_count")
+PRICE_SERIES = "price"     # 价格序列（检测时写入，回测计算远期收益用），指标名 / 原始序列名不得与之重名
+
+def load_metric_registry(path=METRICS_CONFIG_PATH) -> List[Dict[str, Any]]:
+    """读取、校验并补全注册表；文件缺失或内容无效时直接报错（启动即暴露配置问题）。"""
+    with open(path, "r") as f:
+        specs = json.load(f)["metrics"]
+    registry, names, series = [], set(), set()
+    for raw in specs:
+        spec = {"sign": 1, "resolution": "24h", "cache_ttl": None, "lookback_days": 30, **raw}
+        name, kind = spec.get("name"), spec.get("fetcher")
+        if not name or name in names or name == PRICE_SERIES:
+            raise ValueError(f"{path}: 指标名缺失、重复或与价格序列重名：{name!r}")
+        if kind not in METRIC_FETCHER_KINDS:
+            raise ValueError(f"{path}: 指标 {name} 的 fetcher 无效：{kind!r}（可选 {', '.join(METRIC_FETCHER_KINDS)}）")
+        if not isinstance(spec.get("weight"), (int, float)):
+            raise ValueError(f"{path}: 指标 {name} 缺少数值 weight")
+        if spec["sign"] not in (1, -1):
+            raise ValueError(f"{path}: 指标 {name} 的 sign 只能为 1 或 -1")
+        if kind.startswith("glassnode") and not spec.get("path"):
+            raise ValueError(f"{path}: 指标 {name} 缺少 Glassnode path")
+        if kind == "glassnode_pct_change":
+            if not (spec.get("series") and spec.get("window_days")):
+                raise ValueError(f"{path}: 指标 {name} 缺少 series / window_days")
+            if spec.get("window_secret"):
+                spec["window_days"] = get_secret(spec["window_secret"], spec["window_days"])
+            spec["window_days"] = float(spec["window_days"])
+            series.add(spec["series"])
+        if kind == "whale_count" and not isinstance(spec.get("thresholds"), dict):
+            raise ValueError(f"{path}: 指标 {name} 缺少 thresholds（各资产单笔阈值）")
+        names.add(name)
+        registry.append(spec)
+    clash = (names | {PRICE_SERIES}) & series
+    if clash:
+        raise ValueError(f"{path}: 原始序列名与指标名 / 价格序列重名：{', '.join(sorted(clash))}")
+    return registry
 
-# 评分阈值（可在 Secrets 中覆盖）
-OVERHEAT_THRESHOLD = float(get_secret("OVERHEAT_THRESHOLD", 60.0))
-OVERSOLD_THRESHOLD = float(get_secret("OVERSOLD_THRESHOLD", 30.0))
+METRIC_REGISTRY = load_metric_registry()
+
+# 评分阈值（优先级：Secrets > 评分参数文件 > 默认值）
+OVERHEAT_THRESHOLD = float(get_secret("OVERHEAT_THRESHOLD", SCORE_CONFIG.get("overheat_threshold", 60.0)))
+OVERSOLD_THRESHOLD = float(get_secret("OVERSOLD_THRESHOLD", SCORE_CONFIG.get("oversold_threshold", 30.0)))
 
 # 监控资产
 ASSETS = {"BTC": "bitcoin", "ETH": "ethereum"}
 
+# 并发抓取：线程池大小与整轮抓取的总时限（秒），超时未返回的指标记为 0.0
+FETCH_MAX_WORKERS = int(get_secret("FETCH_MAX_WORKERS", 16))
+FETCH_DEADLINE_SEC = float(get_secret("FETCH_DEADLINE_SEC", 20.0))
+
 # 本地历史缓存目录（Streamlit 环境为临时盘）
 HIST_DIR = ".hist_cache_overheat"
 os.makedirs(HIST_DIR, exist_ok=True)
@@ -63,11 +166,332 @@ os.makedirs(HIST_DIR, exist_ok=True)
 def now_utc_str():
     return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
-def http_get_json(url, params=None, timeout=10):
+# --------------------
+# HTTP 传输层（共享连接池 + keep-alive + 429/5xx 带抖动指数退避重试）
+# --------------------
+HTTP_POOL_HOSTS = 10                                     # 连接池缓存的主机数
+HTTP_POOL_PER_HOST = int(get_secret("HTTP_POOL_PER_HOST", 8))  # 每个主机的最大连接数
+HTTP_MAX_RETRIES = int(get_secret("HTTP_MAX_RETRIES", 3))
+HTTP_BACKOFF_BASE = float(get_secret("HTTP_BACKOFF_BASE", 0.5))
+HTTP_BACKOFF_MAX = 8.0
+HTTP_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# 客户端限流：每个数据源一个令牌桶（每分钟请求数, 突发容量），所有抓取共用；超额时排队等待而不是失败
+RATE_LIMITS = {
+    "coingecko": (float(get_secret("RATE_LIMIT_COINGECKO_PER_MIN", 25)), 5),
+    "glassnode": (float(get_secret("RATE_LIMIT_GLASSNODE_PER_MIN", 60)), 10),
+}
+RATE_LIMIT_HOSTS = {"api.coingecko.com": "coingecko", "api.glassnode.com": "glassnode"}
+# 排队等待令牌的上限（默认与每轮抓取时限一致）：超过则直接失败，不让抓取线程长时间阻塞
+RATE_LIMIT_MAX_WAIT_SEC = float(get_secret("RATE_LIMIT_MAX_WAIT_SEC", FETCH_DEADLINE_SEC))
+HTTP_RETRY_AFTER_MAX = 120.0     # 服务端 Retry-After 的采纳上限（秒）
+
+class RateLimitTimeout(requests.RequestException):
+    """等待令牌将超过 max_wait。"""
+
+class TokenBucket:
+    def __init__(self, per_min, capacity):
+        self.rate = per_min / 60.0
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"acquired": 0, "waits": 0, "wait_sec": 0.0, "timeouts": 0}
+
+    def acquire(self, max_wait=None) -> float:
+        """取一个令牌，必要时阻塞等待；返回本次等待秒数。累计等待将超过 max_wait 时抛出 RateLimitTimeout。"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                delay = self.blocked_until - now
+                if delay <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.stats["acquired"] += 1
+                    if waited:
+                        self.stats["waits"] += 1
+                        self.stats["wait_sec"] += waited
+                    return waited
+                if delay <= 0:
+                    delay = (1 - self.tokens) / self.rate
+                if max_wait is not None and waited + delay > max_wait:
+                    self.stats["timeouts"] += 1
+                    raise RateLimitTimeout(f"限流等待 {waited + delay:.1f}s 超过上限 {max_wait:g}s")
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        """服务端返回 Retry-After：在此之前不再发放令牌（最多 HTTP_RETRY_AFTER_MAX 秒）。"""
+        seconds = min(seconds, HTTP_RETRY_AFTER_MAX)
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+def parse_retry_after(value):
+    """Retry-After 可为秒数或 HTTP 日期，返回秒数（无法解析时 None）。"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
     try:
-        r = requests.get(url, params=params, timeout=timeout)
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except Exception:
+        return None
+
+class HttpTransport:
+    """
+    所有出站 HTTP 请求共用的 requests.Session：同一主机复用 TCP/TLS 连接，
+    每主机连接数受 HTTP_POOL_PER_HOST 限制；遇到 retry_status 或连接错误时按
+    full-jitter 指数退避重试（429 带 Retry-After 时按其等待）。已知数据源的请求先经过对应的令牌桶。
+    stats 记录请求、重试与失败次数。
+    """
+    def __init__(self):
+        self.adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_PER_HOST, pool_block=True, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+        self.limiters = {name: TokenBucket(per_min, cap) for name, (per_min, cap) in RATE_LIMITS.items()}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def limiter_for(self, url):
+        return self.limiters.get(RATE_LIMIT_HOSTS.get(urlsplit(url).hostname))
+
+    def request(self, method, url, retry_status=HTTP_RETRY_STATUS, retry_errors=(requests.ConnectionError, requests.Timeout), **kwargs):
+        limiter = self.limiter_for(url)
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire(max_wait=RATE_LIMIT_MAX_WAIT_SEC)
+            self._count("requests")
+            retry_after = None
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except retry_errors:
+                if attempt >= HTTP_MAX_RETRIES:
+                    self._count("failures")
+                    raise
+            else:
+                if r.status_code == 429:
+                    retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                    if retry_after is not None:
+                        retry_after = min(retry_after, HTTP_RETRY_AFTER_MAX)
+                    if retry_after is not None and limiter is not None:
+                        limiter.pause(retry_after)
+                if r.status_code not in retry_status or attempt >= HTTP_MAX_RETRIES:
+                    return r
+                r.close()
+            self._count("retries")
+            if retry_after is None:
+                time.sleep(random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt)))
+            elif limiter is None:
+                time.sleep(retry_after)
+            # 有限流器时，Retry-After 的等待由下一次 acquire() 完成
+            attempt += 1
+
+    def limiter_stats(self) -> Dict[str, Dict[str, float]]:
+        return {name: dict(b.stats) for name, b in self.limiters.items()}
+
+    def connection_stats(self) -> Dict[str, int]:
+        """在 stats 基础上附加连接数：opened 为新建连接，reused 为走已有 keep-alive 连接的请求。"""
+        opened = served = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+        with self._lock:
+            out = dict(self.stats)
+        out.update({"connections_opened": opened, "connections_reused": max(served - opened, 0)})
+        return out
+
+@st.cache_resource
+def get_http() -> HttpTransport:
+    # cache_resource：Streamlit 重跑脚本与后台调度线程共用同一个连接池
+    return HttpTransport()
+
+# --------------------
+# 响应缓存（按 URL + 参数缓存解析后的 JSON：内存 LRU + 可选磁盘层；TTL 与数据本身的更新频率一致）
+# --------------------
+CACHE_MAX_ENTRIES = 512
+CACHE_DISK_MAX_ENTRIES = 2048    # 磁盘层文件数上限，超出时按最近使用时间（mtime）淘汰
+CACHE_DISK_PRUNE_EVERY = 64      # 每写入多少个文件检查一次上限
+CACHE_DISK_ENABLED = get_bool_secret("CACHE_DISK_ENABLED", True)
+CACHE_DIR = os.path.join(HIST_DIR, "http_cache")
+COINGECKO_PRICE_TTL = 30
+# Glassnode 按分辨率（参数 i，缺省为 24h）设置 TTL：日线指标数小时内不会变化
+GLASSNODE_TTL_BY_INTERVAL = {"10m": 300, "1h": 1800, "24h": 3 * 3600, "1w": 12 * 3600}
+
+# 带区间终点的请求（Glassnode 的 u、CoinGecko market_chart/range 的 to）终点通常是"现在"，
+# 每次的参数都不同，缓存只会不断堆积新条目，因此不缓存
+UNCACHED_RANGE_PARAMS = ("u", "to")
+
+def cacheable(url, params=None) -> bool:
+    return not any(k in (params or {}) for k in UNCACHED_RANGE_PARAMS)
+
+def cache_ttl(url, params=None) -> float:
+    params = params or {}
+    if url.startswith(GLASSNODE_BASE):
+        return GLASSNODE_TTL_BY_INTERVAL.get(params.get("i", "24h"), 1800)
+    if url.startswith("https://api.coingecko.com/"):
+        return COINGECKO_PRICE_TTL
+    return 0
+
+def cache_key(url, params=None) -> str:
+    raw = url + "?" + json.dumps(sorted((params or {}).items()), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    条目：{"expires", "payload", "etag", "last_modified"}。过期条目不直接删除（由 LRU 淘汰），
+    其校验信息（ETag / Last-Modified）用于下一次条件请求。
+    """
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, disk_dir=None, disk_max_entries=CACHE_DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "not_modified": 0, "disk_evicted": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self.prune_disk()
+
+    def prune_disk(self):
+        """磁盘层超过 disk_max_entries 个文件时，删除最久未使用（mtime 最早）的文件。"""
+        try:
+            entries = [e for e in os.scandir(self.disk_dir) if e.name.endswith(".json")]
+            excess = len(entries) - self.disk_max_entries
+            if excess <= 0:
+                return
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for e in entries[:excess]:
+                try:
+                    os.remove(e.path)
+                except OSError:
+                    pass
+            self.count("disk_evicted", excess)
+        except OSError:
+            pass
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _lookup(self, key):
+        """(条目, 是否来自磁盘层)；条目不论是否过期。"""
+        with self._lock:
+            e = self._mem.get(key)
+            if e is not None:
+                self._mem.move_to_end(key)
+                return e, False
+        if self.disk_dir:
+            try:
+                p = self._disk_path(key)
+                with open(p, "r") as f:
+                    e = json.load(f)
+                os.utime(p)   # 刷新 mtime，磁盘层按最近使用淘汰
+                self._put_mem(key, e)
+                return e, True
+            except Exception:
+                pass
+        return None, False
+
+    def peek(self, key):
+        """取条目（可能已过期，用于条件请求），不计入命中统计。"""
+        return self._lookup(key)[0]
+
+    def get(self, key):
+        """仅返回未过期的 payload，否则 None。"""
+        e, from_disk = self._lookup(key)
+        if e is not None and e["expires"] > time.time():
+            self.count("disk_hits" if from_disk else "hits")
+            return e["payload"]
+        self.count("misses")
+        return None
+
+    def _put_mem(self, key, entry):
+        with self._lock:
+            self._mem[key] = entry
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def put(self, key, payload, ttl, etag=None, last_modified=None):
+        entry = {"expires": time.time() + ttl, "payload": payload, "etag": etag, "last_modified": last_modified}
+        self._put_mem(key, entry)
+        if self.disk_dir:
+            try:
+                p = self._disk_path(key)
+                with open(p + ".tmp", "w") as f:
+                    json.dump(entry, f)
+                os.replace(p + ".tmp", p)
+            except Exception:
+                return
+            with self._lock:
+                self._disk_writes += 1
+                due = self._disk_writes % CACHE_DISK_PRUNE_EVERY == 0
+            if due:
+                self.prune_disk()
+
+@st.cache_resource
+def get_cache() -> ResponseCache:
+    return ResponseCache(disk_dir=CACHE_DIR if CACHE_DISK_ENABLED else None)
+
+def fetch_json(url, params=None, timeout=10, ttl=None):
+    """
+    带缓存的 GET + JSON 解析；请求失败时抛出异常（失败结果不缓存）。
+    缓存过期后带上 If-None-Match / If-Modified-Since 发条件请求，304 时直接复用已解析的 payload。
+    """
+    if not cacheable(url, params):
+        r = get_http().request("GET", url, params=params, timeout=timeout)
         r.raise_for_status()
         return r.json()
+    ttl = cache_ttl(url, params) if ttl is None else ttl
+    key = cache_key(url, params)
+    cache = get_cache()
+    if ttl > 0:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    stale = cache.peek(key)
+    headers = {}
+    if stale is not None:
+        if stale.get("etag"):
+            headers["If-None-Match"] = stale["etag"]
+        if stale.get("last_modified"):
+            headers["If-Modified-Since"] = stale["last_modified"]
+    r = get_http().request("GET", url, params=params, timeout=timeout, headers=headers)
+    if r.status_code == 304 and stale is not None:
+        cache.count("not_modified")
+        cache.put(key, stale["payload"], ttl, stale.get("etag"), stale.get("last_modified"))
+        return stale["payload"]
+    r.raise_for_status()
+    data = r.json()
+    etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+    if data is not None and (ttl > 0 or etag or last_modified):
+        cache.put(key, data, max(ttl, 0), etag, last_modified)
+    return data
+
+def http_get_json(url, params=None, timeout=10):
+    try:
+        return fetch_json(url, params=params, timeout=timeout)
     except Exception as e:
         st.warning(f"HTTP 请求失败: {e}")
         return None
@@ -75,58 +499,531 @@ def http_get_json(url, params=None, timeout=10):
 # --------------------
 # 数据抓取（CoinGecko + optional Glassnode）
 # --------------------
-def fetch_price_coingecko(asset_id: str) -> Dict[str, Any]:
-    url = "https://api.coingecko.com/api/v3/coins/markets"
-    params = {"vs_currency": "usd", "ids": asset_id, "price_change_percentage": "24h"}
-    j = http_get_json(url, params=params)
+COINGECKO_MARKETS_URL = "https://api.coingecko.com/api/v3/coins/markets"
+COINGECKO_MAX_PER_PAGE = 250  # /coins/markets 单页上限
+
+def fetch_prices_coingecko(asset_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    批量抓取价格：一次 /coins/markets 请求取回多个资产（ids 逗号分隔），
+    返回 {asset_id: {"price", "price_change_24h_pct"}}；缺失的资产值为 None。
+    """
+    out = {a: {"price": None, "price_change_24h_pct": None} for a in asset_ids}
+    ids = list(dict.fromkeys(asset_ids))
+    for i in range(0, len(ids), COINGECKO_MAX_PER_PAGE):
+        chunk = ids[i:i + COINGECKO_MAX_PER_PAGE]
+        params = {"vs_currency": "usd", "ids": ",".join(chunk), "price_change_percentage": "24h", "per_page": len(chunk), "page": 1}
+        j = http_get_json(COINGECKO_MARKETS_URL, params=params)
+        if not j:
+            continue
+        for d in j:
+            if d.get("id") in out:
+                out[d["id"]] = {"price": d.get("current_price"), "price_change_24h_pct": d.get("price_change_percentage_24h")}
+    return out
+
+def fetch_price_history_coingecko(asset_id: str, since: float, until: float):
+    """/coins/{id}/market_chart/range 的 USD 价格序列 [(t, price)]（t 为 unix 秒）。"""
+    url = f"https://api.coingecko.com/api/v3/coins/{asset_id}/market_chart/range"
+    j = http_get_json(url, params={"vs_currency": "usd", "from": int(since), "to": int(until)}, timeout=30)
     if not j:
-        return {"price": None, "price_change_24h_pct": None}
-    d = j[0]
-    return {"price": d.get("current_price"), "price_change_24h_pct": d.get("price_change_percentage_24h")}
+        return []
+    return [(ms / 1000.0, float(p)) for ms, p in j.get("prices", []) if p is not None]
 
 GLASSNODE_BASE = "https://api.glassnode.com/v1"
-def glassnode_try(metric, asset_symbol):
+def glassnode_try(metric, asset_symbol, interval=None, ttl=None):
     """
     轻量尝试调用 Glassnode 指标（返回最新点值）。若未配置 API key 则返回 None。
-    若需要更复杂的历史序列计算，可后续扩展。
+    需要历史序列时使用 glassnode_series。
     """
     if not GLASSNODE_API_KEY:
         return None
     url = f"{GLASSNODE_BASE}/metrics/{metric}"
     params = {"a": asset_symbol, "api_key": GLASSNODE_API_KEY}
+    if interval:
+        params["i"] = interval
     try:
-        r = requests.get(url, params=params, timeout=8)
-        r.raise_for_status()
-        data = r.json()
+        data = fetch_json(url, params=params, timeout=8, ttl=ttl)
         if isinstance(data, list) and len(data) > 0:
             return data[-1].get("v")
         return data
     except Exception:
         return None
 
-def fetch_exchange_flow(sym: str):
-    v = glassnode_try("transactions/TransfersVolumeToExchangesSum", sym)
-    return float(v) if v is not None else 0.0
+def glassnode_series(metric, asset_symbol, since=None, until=None, interval="24h"):
+    """
+    拉取 Glassnode 指标的完整序列 [(t, v)]（t 为 unix 秒），s/u/i 对应起止时间与分辨率。
+    未配置 API key 或请求失败时返回 []。
+    """
+    if not GLASSNODE_API_KEY:
+        return []
+    params = {"a": asset_symbol, "api_key": GLASSNODE_API_KEY, "i": interval}
+    if since is not None:
+        params["s"] = int(since)
+    if until is not None:
+        params["u"] = int(until)
+    try:
+        data = fetch_json(f"{GLASSNODE_BASE}/metrics/{metric}", params=params, timeout=30)
+    except Exception:
+        return []
+    if not isinstance(data, list):
+        return []
+    return [(float(d["t"]), float(d["v"])) for d in data if isinstance(d, dict) and isinstance(d.get("v"), (int, float))]
+
+# 直接取自 Glassnode 的指标（注册表中 fetcher = glassnode）：指标名 -> Glassnode metric 路径
+GLASSNODE_METRICS = {s["name"]: s["path"] for s in METRIC_REGISTRY if s["fetcher"] == "glassnode"}
 
-def fetch_etf_netflow(sym: str):
-    v = glassnode_try("institutions/UsSpotEtfFlowsNet", sym)
-    return float(v) if v is not None else 0.0
+# --------------------
+# Glassnode 指标批量请求：声明式的 (metric 路径, 资产, 分辨率) 列表先去重，再按 (路径, 分辨率)
+# 合并为一次 bulk 请求（a 参数重复携带多个资产），结果按资产分发；bulk 不可用时回退为逐资产请求
+# --------------------
+GLASSNODE_BULK_ENABLED = get_bool_secret("GLASSNODE_BULK_ENABLED", True)
+GLASSNODE_RESOLUTION = "24h"
+# bulk 请求返回 4xx（套餐不支持 / 参数被拒）后置位，本进程之后的各轮直接逐资产请求
+_glassnode_bulk_unsupported = threading.Event()
 
-def fetch_funding_rate(sym: str):
-    v = glassnode_try("derivatives/FuturesFundingRatePerpetual", sym)
-    return float(v) if v is not None else 0.0
+def glassnode_bulk_latest(metric, symbols, interval=GLASSNODE_RESOLUTION, ttl=None) -> Dict[str, Any]:
+    """一个指标、多个资产的最新点值 {sym: v}；bulk 响应缺失的资产逐个补请求。"""
+    if not GLASSNODE_API_KEY:
+        return {}
+    latest = {}
+    if GLASSNODE_BULK_ENABLED and not _glassnode_bulk_unsupported.is_set() and len(symbols) > 1:
+        step = INTERVAL_SEC.get(interval, 86400)
+        # 起点对齐到分辨率边界，保证同一周期内缓存键不变
+        params = {"a": sorted(symbols), "i": interval, "api_key": GLASSNODE_API_KEY,
+                  "s": (int(time.time()) // step - 3) * step}
+        try:
+            # 响应：{"data": [{"t": ..., "bulk": [{"a": "BTC", "v": ...}, ...]}, ...]}，按时间升序
+            data = fetch_json(f"{GLASSNODE_BASE}/metrics/{metric}/bulk", params=params, timeout=15, ttl=ttl)
+            for row in data.get("data", []):
+                for item in row.get("bulk", []):
+                    if item.get("a") in symbols and isinstance(item.get("v"), (int, float)):
+                        latest[item["a"]] = item["v"]
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status is not None and 400 <= status < 500 and status != 429 and not _glassnode_bulk_unsupported.is_set():
+                _glassnode_bulk_unsupported.set()
+                st.warning(f"Glassnode bulk 请求返回 HTTP {status}，本次运行改为逐资产请求。")
+            latest = {}
+        except Exception:
+            latest = {}
+    for sym in symbols:
+        if sym not in latest:
+            latest[sym] = glassnode_try(metric, sym, interval, ttl)
+    return latest
 
-def fetch_oi_change_pct(sym: str):
-    # 简化：返回 0.0（可扩展为拉 7d/30d 序列并计算 pct change）
-    return 0.0
+def fetch_glassnode_bundle(plan) -> Dict[tuple, Any]:
+    """
+    plan: [(metric 路径, 资产, 分辨率, 缓存 TTL), ...]，重复项只请求一次（同组 TTL 取最小值，None 为按分辨率默认）。
+    返回 {(metric 路径, 资产, 分辨率): 最新值}；各 (路径, 分辨率) 组并发请求。
+    """
+    groups, ttls = {}, {}
+    for metric, sym, interval, ttl in plan:
+        syms = groups.setdefault((metric, interval), [])
+        if sym not in syms:
+            syms.append(sym)
+        if ttl is not None:
+            ttls[(metric, interval)] = min(ttl, ttls.get((metric, interval), ttl))
+    out = {}
+    if not groups:
+        return out
+    with ThreadPoolExecutor(max_workers=min(len(groups), FETCH_MAX_WORKERS), thread_name_prefix="glassnode") as ex:
+        futures = {ex.submit(glassnode_bulk_latest, metric, syms, interval, ttls.get((metric, interval))): (metric, interval)
+                   for (metric, interval), syms in groups.items()}
+        for fut, (metric, interval) in futures.items():
+            try:
+                for sym, v in fut.result().items():
+                    out[(metric, sym, interval)] = v
+            except Exception:
+                pass
+    return out
 
-def fetch_reserve_change_pct(sym: str):
-    # 交易所储备变化 pct（简化实现）
-    return 0.0
+def fetch_glassnode_latest(symbols, specs):
+    """fetcher = glassnode 的指标：symbols × specs 合并为一个批量计划，返回 {(sym, 指标名): 值}。"""
+    bundle = fetch_glassnode_bundle([(s["path"], sym, s["resolution"], s["cache_ttl"]) for sym in symbols for s in specs])
+    out = {}
+    for sym in symbols:
+        for s in specs:
+            v = bundle.get((s["path"], sym, s["resolution"]))
+            if v is not None:
+                out[(sym, s["name"])] = float(v)
+    return out
+
+# --------------------
+# 派生指标：原始序列同步到本地历史存储（首次拉取回看窗口，之后只请求末条之后的尾部），
+# 变化率从本地序列计算（两次二分查找），不再每轮重拉整个窗口
+# --------------------
+def sync_glassnode_series(sym, metric_path, series, lookback_days, interval="24h", now=None):
+    """把 Glassnode 原始序列增量同步到 (ASSETS[sym], series)，返回新增点数。"""
+    if not GLASSNODE_API_KEY:
+        return 0
+    cg_id = ASSETS[sym]
+    now = time.time() if now is None else now
+    # 与该序列的追加 / 重写共用一把锁：同一序列的同步互斥，不同序列仍可在抓取线程池中并发请求
+    with hist_lock(cg_id, series):
+        last = last_hist_ts(cg_id, series)
+        if last is None:
+            return merge_hist(cg_id, series, glassnode_series(metric_path, sym, since=now - lookback_days * 86400, until=now, interval=interval))
+        if now - last < INTERVAL_SEC.get(interval, 86400):
+            return 0   # 下一个点尚未产生，无需请求
+        new = [(t, v) for t, v in glassnode_series(metric_path, sym, since=last + 1, until=now, interval=interval) if t > last]
+        for t, v in new:
+            append_hist(cg_id, series, v, ts=t)
+        return len(new)
+
+def series_pct_change(asset, series, days):
+    """本地序列末点相对 days 天前（as-of）的变化率（%）；数据不足时为 0.0。只读两个点，不拷贝序列。"""
+    try:
+        with _SeriesView(asset, series) as sv:
+            if not sv.count:
+                return 0.0
+            last_ts, last_val = sv.ts[sv.count - 1], sv.val[sv.count - 1]
+            i = bisect.bisect_right(sv.ts, last_ts - days * 86400) - 1
+            base = sv.val[i] if i >= 0 else 0.0
+    except Exception:
+        return 0.0
+    if not base:
+        return 0.0
+    return (last_val / base - 1.0) * 100
+
+def pct_change_series(ts, vals, days):
+    """整条序列逐点的 days 天变化率（%），用于回填派生指标历史。"""
+    ts, vals = np.asarray(ts, dtype=float), np.asarray(vals, dtype=float)
+    idx = np.searchsorted(ts, ts - days * 86400, side="right") - 1
+    base = np.where(idx >= 0, vals[np.clip(idx, 0, None)], np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pct = (vals / base - 1.0) * 100
+    ok = (idx >= 0) & np.isfinite(pct)
+    return [(float(t), float(v)) for t, v, k in zip(ts, pct, ok) if k]
+
+# 变化率类指标（注册表中 fetcher = glassnode_pct_change）
+def fetch_series_pct_changes(sym, path, series, specs):
+    """同一原始序列上的变化率指标共用一次增量同步，返回 {(sym, 指标名): 变化率}。"""
+    if not GLASSNODE_API_KEY:
+        return {}
+    lookback = max(max(s["lookback_days"], s["window_days"] + 1) for s in specs)
+    sync_glassnode_series(sym, path, series, lookback, interval=specs[0]["resolution"])
+    return {(sym, s["name"]): series_pct_change(ASSETS[sym], series, s["window_days"]) for s in specs}
+
+# 派生指标 -> (Glassnode 原始指标路径, 本地原始序列名, 变化率窗口天数)，供历史回填使用
+DERIVED_PCT_METRICS = {s["name"]: (s["path"], s["series"], s["window_days"]) for s in METRIC_REGISTRY if s["fetcher"] == "glassnode_pct_change"}
+
+# --------------------
+# 巨鲸转账计数：从大额转账事件流（本地 JSONL / NDJSON 或 Whale Alert API）流式读取，
+# 按资产阈值过滤后计入固定时长分桶的滚动计数器，每轮查询 O(1)
+# - 事件格式：{"timestamp": unix 秒, "symbol": "btc", "amount": 币数量}（与 Whale Alert 交易记录一致）
+# --------------------
+WHALE_EVENTS_PATH = get_secret("WHALE_EVENTS_PATH", None)       # 本地事件文件（可被外部进程持续追加）
+WHALE_ALERT_API_KEY = get_secret("WHALE_ALERT_API_KEY", None)
+WHALE_ALERT_URL = "https://api.whale-alert.io/v1/transactions"
+WHALE_ALERT_MIN_USD = 500000                                    # API 端预过滤（美元），精确阈值在本地按币数量过滤
+WHALE_WINDOW_HOURS = float(get_secret("WHALE_WINDOW_HOURS", 24))
+WHALE_BUCKET_MIN = 60
+
+class RollingBucketCounter:
+    """环形分桶计数：窗口内总数随写入 / 过期增量维护，count() 为 O(1)（推进时只清理过期桶）。"""
+    def __init__(self, window_sec, bucket_sec):
+        self.bucket_sec = bucket_sec
+        self.n = max(int(math.ceil(window_sec / bucket_sec)), 1)
+        self.counts = [0] * self.n
+        self.head = None      # 最新桶编号
+        self.total = 0
+
+    def _advance(self, b):
+        if self.head is None:
+            self.head = b
+            return
+        if b <= self.head:
+            return
+        for k in range(self.head + 1, min(b, self.head + self.n) + 1):
+            self.total -= self.counts[k % self.n]
+            self.counts[k % self.n] = 0
+        self.head = b
+
+    def add(self, ts, n=1):
+        b = int(ts // self.bucket_sec)
+        self._advance(b)
+        if b <= self.head - self.n:
+            return   # 早于窗口的事件直接丢弃
+        self.counts[b % self.n] += n
+        self.total += n
+
+    def count(self, now=None):
+        self._advance(int((time.time() if now is None else now) // self.bucket_sec))
+        return self.total
+
+def iter_whale_events_file(path, offset=0):
+    """从 offset 起逐行读取事件文件，yield (下一行偏移, 事件)；末尾未写完的行留到下次。"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            offset += len(line)
+            try:
+                yield offset, json.loads(line)
+            except ValueError:
+                yield offset, None
+
+def iter_whale_events_api(since):
+    """按 cursor 翻页拉取 Whale Alert 交易，逐条 yield。"""
+    params = {"api_key": WHALE_ALERT_API_KEY, "start": int(since), "min_value": WHALE_ALERT_MIN_USD}
+    while True:
+        data = fetch_json(WHALE_ALERT_URL, params=params, timeout=15, ttl=0)
+        txs = data.get("transactions") or []
+        yield from txs
+        if not data.get("cursor") or len(txs) < data.get("count", 0) or not txs:
+            return
+        params["cursor"] = data["cursor"]
+
+def whale_filter(events, thresholds):
+    """流式过滤：只保留达到对应资产阈值（币数量）的事件，yield (SYM, amount, timestamp)。"""
+    for ev in events:
+        if not isinstance(ev, dict):
+            continue
+        sym = str(ev.get("symbol", "")).upper()
+        limit = thresholds.get(sym)
+        if limit is None:
+            continue
+        try:
+            amount, ts = float(ev.get("amount", 0)), float(ev["timestamp"])
+        except (TypeError, ValueError, KeyError):
+            continue
+        if amount >= limit:
+            yield sym, amount, ts
+
+class WhaleCounter:
+    """(sym, 阈值) -> RollingBucketCounter；记录文件读取偏移 / API 起始时间，每轮只处理新增事件。"""
+    def __init__(self):
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._reset([])
+
+    def _reset(self, keys):
+        self.counters = {k: RollingBucketCounter(WHALE_WINDOW_HOURS * 3600, WHALE_BUCKET_MIN * 60) for k in keys}
+        self._offset = 0
+        self._api_since = time.time() - WHALE_WINDOW_HOURS * 3600
+
+    def _file_events(self):
+        for offset, ev in iter_whale_events_file(WHALE_EVENTS_PATH, self._offset):
+            self._offset = offset
+            yield ev
+
+    def _api_events(self):
+        since = self._api_since
+        for ev in iter_whale_events_api(since):
+            self._api_since = max(self._api_since, float(ev.get("timestamp", since)) + 1)
+            yield ev
+
+    def _consume(self, events):
+        by_sym = {}
+        for sym, thr in self.counters:
+            by_sym.setdefault(sym, []).append(thr)
+        for sym, amount, ts in whale_filter(events, {s: min(t) for s, t in by_sym.items()}):
+            for thr in by_sym[sym]:
+                if amount >= thr:
+                    self.counters[(sym, thr)].add(ts)
+
+    def ingest(self, keys):
+        """读取新事件（文件只读新增行，API 只拉上次之后的交易）；出现新的 (sym, 阈值) 时从头重建。"""
+        with self._lock:
+            if set(keys) - set(self.counters):
+                self._reset(set(keys) | set(self.counters))
+            if WHALE_EVENTS_PATH and os.path.exists(WHALE_EVENTS_PATH):
+                if os.path.getsize(WHALE_EVENTS_PATH) < self._offset:
+                    self._reset(list(self.counters))    # 文件被截断 / 轮换
+                self._consume(self._file_events())
+            elif WHALE_ALERT_API_KEY:
+                try:
+                    self._consume(self._api_events())
+                except Exception:
+                    pass
+
+    def count(self, sym, threshold):
+        with self._lock:
+            c = self.counters.get((sym, threshold))
+            return c.count() if c is not None else 0
+
+@st.cache_resource
+def get_whale_counter() -> WhaleCounter:
+    return WhaleCounter()
 
 def fetch_whale_count(sym: str, threshold_amount: float):
-    # 简化占位，返回 0；可改为调用 Kaiko/Glassnode 的 whale metrics
-    return 0
+    """最近 WHALE_WINDOW_HOURS 小时内单笔 >= threshold_amount 的转账笔数；未配置事件来源时为 0。"""
+    if not (WHALE_EVENTS_PATH or WHALE_ALERT_API_KEY):
+        return 0
+    wc = get_whale_counter()
+    wc.ingest([(sym, threshold_amount)])
+    return wc.count(sym, threshold_amount)
+
+# --------------------
+# 实时价格流（可选）：与交易所 ticker WebSocket 保持长连接，维护内存中的最新价格 / 24h 涨跌表
+# - 断线后指数退避重连并重新订阅（ticker 为快照消息，重连后下一条即恢复最新状态）
+# - PRICE_STREAM_URL 可指向任意兼容 combined stream 格式的服务（如本地回放），便于离线调试
+# --------------------
+PRICE_STREAM_ENABLED = get_bool_secret("PRICE_STREAM_ENABLED", False)
+PRICE_STREAM_URL = get_secret("PRICE_STREAM_URL", "wss://stream.binance.com:9443/stream")
+PRICE_STREAM_STALE_SEC = 120     # 超过该时长未更新的报价视为失效，回退到 CoinGecko
+PRICE_STREAM_RECONNECT_MAX = 60
+
+def stream_symbol(sym):
+    return f"{sym.lower()}usdt"
+
+class PriceStream:
+    def __init__(self, symbols, url=PRICE_STREAM_URL):
+        self.base_url = url
+        self._by_stream = {stream_symbol(s): s for s in symbols}
+        self.table = {}            # sym -> {"price", "price_change_24h_pct", "event_ts", "recv_ts"}
+        self.listeners = []        # 每条报价回调 fn(sym, ts, price)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._ws = None
+        self.stats = {"messages": 0, "reconnects": 0, "connected": False}
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="price-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.abort()   # 直接关闭底层 socket，打断阻塞中的 recv
+            except Exception:
+                pass
+
+    def _url(self):
+        return self.base_url + "?streams=" + "/".join(f"{s}@ticker" for s in self._by_stream)
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            ws = None
+            try:
+                ws = self._ws = websocket.create_connection(self._url(), timeout=30)
+                self.stats["connected"] = True
+                backoff = 1.0
+                while not self._stop.is_set():
+                    self.handle(ws.recv())
+            except Exception:
+                if not self._stop.is_set():
+                    self.stats["reconnects"] += 1
+            finally:
+                self.stats["connected"] = False
+                self._ws = None
+                if ws is not None:
+                    try:
+                        ws.close()
+                    except Exception:
+                        pass
+            self._stop.wait(random.uniform(0.5, 1.0) * backoff)
+            backoff = min(backoff * 2, PRICE_STREAM_RECONNECT_MAX)
+
+    def handle(self, raw):
+        """解析一条 ticker 消息（兼容 combined stream 的 {"stream", "data"} 包装），返回事件时间。"""
+        try:
+            msg = json.loads(raw)
+            data = msg.get("data", msg)
+            sym = self._by_stream.get(str(data.get("s", "")).lower())
+            if data.get("e") != "24hrTicker" or sym is None:
+                return None
+            price, pct = float(data["c"]), float(data["P"])
+            event_ts = data.get("E", time.time() * 1000) / 1000.0
+        except Exception:
+            return None
+        with self._lock:
+            self.table[sym] = {"price": price, "price_change_24h_pct": pct, "event_ts": event_ts, "recv_ts": time.time()}
+            self.stats["messages"] += 1
+            listeners = list(self.listeners)
+        for fn in listeners:
+            try:
+                fn(sym, event_ts, price)
+            except Exception:
+                pass
+        return event_ts
+
+    def latest(self, sym, max_age=PRICE_STREAM_STALE_SEC):
+        with self._lock:
+            rec = self.table.get(sym)
+        if rec is None or time.time() - rec["recv_ts"] > max_age:
+            return None
+        return rec
+
+@st.cache_resource
+def get_price_stream() -> PriceStream:
+    stream = PriceStream(list(ASSETS), url=PRICE_STREAM_URL)
+    stream.listeners.append(lambda sym, ts, price: get_price_rules().on_tick(sym, ts, price))
+    return stream
+
+def price_stream_active():
+    return PRICE_STREAM_ENABLED and websocket is not None
+
+def current_prices() -> Dict[str, Dict[str, Any]]:
+    """{asset_id: {"price", "price_change_24h_pct"}}：优先取实时价格流，缺失或过期的资产批量回退到 CoinGecko。"""
+    out, missing = {}, []
+    stream = get_price_stream() if price_stream_active() else None
+    for sym, cg_id in ASSETS.items():
+        rec = stream.latest(sym) if stream is not None else None
+        if rec is not None:
+            out[cg_id] = {"price": rec["price"], "price_change_24h_pct": rec["price_change_24h_pct"]}
+        else:
+            missing.append(cg_id)
+    if missing:
+        out.update(fetch_prices_coingecko(missing))
+    return out
+
+# --------------------
+# 并发抓取阶段（所有资产 × 所有指标同时发出）
+# --------------------
+def fetch_whale_counts(sym, spec):
+    return {(sym, spec["name"]): fetch_whale_count(sym, threshold_amount=spec["thresholds"].get(sym, 1000))}
+
+def build_fetch_plan(symbols, registry=None) -> List[tuple]:
+    """
+    由注册表展开抓取计划 [(任务函数, 参数), ...]，每个任务返回 {(sym, 指标名): 值}：
+    - glassnode：所有资产 × 指标合并为一个批量任务（去重 + bulk）
+    - glassnode_pct_change：按 (资产, 原始序列) 分组，同一序列每轮只同步一次
+    - whale_count：每个 (资产, 指标) 一个任务
+    """
+    registry = METRIC_REGISTRY if registry is None else registry
+    direct = [s for s in registry if s["fetcher"] == "glassnode"]
+    plan = [(fetch_glassnode_latest, (list(symbols), direct))] if direct else []
+    by_series = {}
+    for sym in symbols:
+        for s in registry:
+            if s["fetcher"] == "glassnode_pct_change":
+                by_series.setdefault((sym, s["path"], s["series"]), []).append(s)
+            elif s["fetcher"] == "whale_count":
+                plan.append((fetch_whale_counts, (sym, s)))
+    plan.extend((fetch_series_pct_changes, (sym, path, series, specs)) for (sym, path, series), specs in by_series.items())
+    return plan
+
+# 监控资产的抓取计划在启动时一次性生成
+FETCH_PLAN = build_fetch_plan(list(ASSETS))
+
+def fetch_all_metrics(symbols: List[str]) -> Dict[str, Dict[str, float]]:
+    """
+    用有界线程池并发执行抓取计划，整轮受 FETCH_DEADLINE_SEC 约束。
+    单个指标失败或超时记为 0.0（与各 fetch_* 的退化值一致）。
+    """
+    out = {sym: {s["name"]: 0.0 for s in METRIC_REGISTRY} for sym in symbols}
+    plan = FETCH_PLAN if list(symbols) == list(ASSETS) else build_fetch_plan(symbols)
+    pool = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS, thread_name_prefix="fetch")
+    futures = [pool.submit(fn, *args) for fn, args in plan]
+    done, not_done = wait(futures, timeout=FETCH_DEADLINE_SEC)
+    for fut in done:
+        try:
+            for (sym, k), v in fut.result().items():
+                out[sym][k] = float(v)
+        except Exception:
+            pass
+    if not_done:
+        st.warning(f"{len(not_done)} 个抓取任务未在 {FETCH_DEADLINE_SEC:.0f}s 内返回，相关指标本轮按 0.0 处理。")
+    pool.shutdown(wait=False, cancel_futures=True)
+    return out
 
 # --------------------
 # 评分逻辑（z-score -> 0-100 映射）
@@ -145,55 +1042,414 @@ def normalize_score(raw, minv=-3, maxv=3):
     return (clipped - minv) / (maxv - minv) * 100
 
 def compute_overheat_score(metrics: Dict[str, float], hist_stats: Dict[str, List[float]]):
+    """参考实现（供测试对照）：对完整历史列表逐个计算 z-score。线上路径见 score_assets。"""
     # 各指标 z-score
     z = {}
     for k, v in metrics.items():
         z[k] = compute_zscore(v, hist_stats.get(k, []))
-    # 权重示例（可后续回测调整）
-    raw = 0.0
-    raw += z.get("etf_netflow", 0.0) * 0.30
-    raw += z.get("exchange_netflow", 0.0) * 0.15
-    raw += z.get("oi_change_pct", 0.0) * 0.15
-    raw += z.get("funding_rate", 0.0) * 0.10
-    raw += z.get("whale_count", 0.0) * 0.10
-    raw += (-z.get("reserve_change_pct", 0.0)) * 0.20
-    score = normalize_score(raw, -3, 3)
-    return score, z
-
-# --------------------
-# 本地历史存储（简单 JSON 文件）
-# --------------------
-def hist_path(asset, metric):
-    return os.path.join(HIST_DIR, f"{asset}__{metric}.json")
-
-def load_hist(asset, metric, days=90):
-    p = hist_path(asset, metric)
-    if not os.path.exists(p):
-        return []
+    return normalize_score(overheat_raw(z), -3, 3), z
+
+# 指标权重取自注册表（weight × sign）；负权重表示反向贡献（交易所储备下降视为过热）。评分参数文件中的权重优先
+METRIC_WEIGHTS = {s["name"]: s["sign"] * abs(float(s["weight"])) for s in METRIC_REGISTRY}
+METRIC_WEIGHTS.update({k: float(v) for k, v in SCORE_CONFIG.get("weights", {}).items() if k in METRIC_WEIGHTS})
+METRIC_NAMES = list(METRIC_WEIGHTS)
+
+def overheat_raw(z: Dict[str, float]) -> float:
+    return sum(z.get(k, 0.0) * w for k, w in METRIC_WEIGHTS.items())
+
+# --------------------
+# 向量化评分（资产 × 指标矩阵，列顺序为 METRIC_NAMES）
+# --------------------
+def weight_vector(weights: Dict[str, float] = None) -> np.ndarray:
+    weights = METRIC_WEIGHTS if weights is None else weights
+    return np.array([weights.get(k, 0.0) for k in METRIC_NAMES], dtype=float)
+
+def zscores_from_stats(current: np.ndarray, n: np.ndarray, mu: np.ndarray, sigma: np.ndarray) -> np.ndarray:
+    """逐元素 z-score；样本数 < 2 或标准差为 0 处记为 0（与 compute_zscore 一致）。"""
+    ok = (n >= 2) & (sigma > 1e-12 * np.maximum(1.0, np.abs(np.nan_to_num(mu))))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(ok, (current - mu) / np.where(ok, sigma, 1.0), 0.0)
+
+def vectorized_zscores(current: np.ndarray, hist: np.ndarray) -> np.ndarray:
+    """current: (A, M) 当前值；hist: (A, M, W) 历史窗口，长度不足处以 NaN 填充。返回 (A, M)。"""
+    n = np.sum(~np.isnan(hist), axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mu = np.nansum(hist, axis=-1) / n
+        sigma = np.sqrt(np.nansum((hist - mu[..., None]) ** 2, axis=-1) / n)
+    return zscores_from_stats(current, n, mu, sigma)
+
+def normalize_scores(raw: np.ndarray, minv=-3, maxv=3) -> np.ndarray:
+    """normalize_score 的向量化版本。"""
+    return (np.clip(raw, minv, maxv) - minv) / (maxv - minv) * 100
+
+def vectorized_scores(z: np.ndarray, weights: Dict[str, float] = None, minv=-3, maxv=3) -> np.ndarray:
+    """(..., M) z-score -> (...) 0-100 分数，等价于 normalize_score(overheat_raw(z))。"""
+    return normalize_scores(z @ weight_vector(weights), minv, maxv)
+
+def vectorized_overheat_scores(current: np.ndarray, hist: np.ndarray, weights: Dict[str, float] = None):
+    z = vectorized_zscores(current, hist)
+    return vectorized_scores(z, weights), z
+
+def score_assets(asset_ids: List[str], metrics: List[Dict[str, float]], now=None):
+    """线上评分：当前值矩阵 + 滚动统计状态（n, mean, pstdev）一次性算出所有资产的分数与 z-score。"""
+    rolling = get_rolling()
+    current = np.array([[m.get(k, 0.0) for k in METRIC_NAMES] for m in metrics], dtype=float).reshape(len(asset_ids), len(METRIC_NAMES))
+    stats = np.array([[rolling.window_stats(a, k, now=now) for k in METRIC_NAMES] for a in asset_ids], dtype=float).reshape(len(asset_ids), len(METRIC_NAMES), 3)
+    z = zscores_from_stats(current, stats[..., 0], stats[..., 1], stats[..., 2])
+    return vectorized_scores(z), z
+
+# --------------------
+# 本地历史存储（列式二进制时间序列：每个 (asset, metric) 一个 .ts 与一个 .val 文件，均为 float64 数组）
+# - 追加 O(1)；时间戳单调不减，时间区间查询在 mmap 的 .ts 列上二分查找
+# - 每个 (asset, metric) 一把可重入锁，追加、整体重写与打开两列互斥（进程内）
+# - 整体重写先写两列临时文件，再落提交标记 .commit，之后才逐列换入；中断后由 _recover_series
+#   前滚（有标记）或丢弃临时文件（无标记），两列不会出现新旧混搭
+# --------------------
+HIST_COL = struct.Struct("<d")
+
+_hist_locks = {}
+_hist_locks_guard = threading.Lock()
+
+def hist_lock(asset, metric):
+    with _hist_locks_guard:
+        return _hist_locks.setdefault((asset, metric), threading.RLock())
+
+def hist_path(asset, metric, column="val"):
+    return os.path.join(HIST_DIR, f"{asset}__{metric}.{column}")
+
+def _recover_series(asset, metric):
+    """完成或回滚被中断的整体重写（调用方持有 hist_lock）。"""
+    marker = hist_path(asset, metric, "commit")
+    committed = os.path.exists(marker)
+    for column in ("val", "ts"):
+        tmp = hist_path(asset, metric, column) + ".tmp"
+        if os.path.exists(tmp):
+            if committed:
+                os.replace(tmp, hist_path(asset, metric, column))
+            else:
+                os.remove(tmp)
+    if committed:
+        os.remove(marker)
+
+def _migrate_legacy_hist(asset, metric):
+    """旧格式 {asset}__{metric}.json（纯数值列表）一次性转为列式，时间戳按检测间隔从文件修改时间回推。"""
+    if os.path.exists(hist_path(asset, metric, "ts")):
+        return
+    legacy = os.path.join(HIST_DIR, f"{asset}__{metric}.json")
+    if not os.path.exists(legacy):
+        return
     try:
-        with open(p, "r") as f:
+        with open(legacy, "r") as f:
             arr = json.load(f)
-        return arr[-days:]
-    except:
+        end, step = os.path.getmtime(legacy), CHECK_INTERVAL_MIN * 60
+        pairs = [(end - (len(arr) - 1 - i) * step, float(v)) for i, v in enumerate(arr)]
+        _write_series(asset, metric, pairs)
+        os.remove(legacy)
+    except Exception:
+        pass
+
+def _write_series(asset, metric, pairs):
+    """整体重写一条序列（两列临时文件 + 提交标记，见本节说明）；pairs 需已按时间排序。"""
+    with hist_lock(asset, metric):
+        _recover_series(asset, metric)
+        for column, idx in (("val", 1), ("ts", 0)):
+            with open(hist_path(asset, metric, column) + ".tmp", "wb") as f:
+                f.write(struct.pack(f"<{len(pairs)}d", *(pt[idx] for pt in pairs)))
+                f.flush()
+                os.fsync(f.fileno())
+        marker = hist_path(asset, metric, "commit")
+        with open(marker, "wb") as f:
+            os.fsync(f.fileno())
+        for column in ("val", "ts"):
+            os.replace(hist_path(asset, metric, column) + ".tmp", hist_path(asset, metric, column))
+        os.remove(marker)
+
+class _SeriesView:
+    """mmap 打开一条序列，ts / val 为零拷贝的 float64 memoryview；两列长度不一致时取较短者。"""
+    def __init__(self, asset, metric):
+        self.asset, self.metric = asset, metric
+        self.ts = self.val = None
+        self.count = 0
+        self._maps, self._files = [], []
+
+    def __enter__(self):
+        cols = {}
+        # 两列在锁内一起映射，得到同一版本的一对文件；映射建立后不受后续重写影响
+        with hist_lock(self.asset, self.metric):
+            _recover_series(self.asset, self.metric)
+            _migrate_legacy_hist(self.asset, self.metric)
+            for column in ("ts", "val"):
+                p = hist_path(self.asset, self.metric, column)
+                if not os.path.exists(p) or os.path.getsize(p) < HIST_COL.size:
+                    return self
+                f = open(p, "rb")
+                self._files.append(f)
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps.append(mm)
+                cols[column] = memoryview(mm)[:len(mm) - len(mm) % HIST_COL.size].cast("d")
+        self.count = min(len(cols["ts"]), len(cols["val"]))
+        self.ts, self.val = cols["ts"][:self.count], cols["val"][:self.count]
+        cols["ts"].release()
+        cols["val"].release()
+        return self
+
+    def __exit__(self, *exc):
+        for v in (self.ts, self.val):
+            if v is not None:
+                v.release()
+        for mm in self._maps:
+            mm.close()
+        for f in self._files:
+            f.close()
+
+def query_hist(asset, metric, start=None, end=None):
+    """
+    时间区间查询 [start, end]（unix 秒，None 表示不限），返回 (timestamps, values)。
+    边界通过二分查找定位，只拷贝命中区间。
+    """
+    try:
+        with _SeriesView(asset, metric) as sv:
+            if not sv.count:
+                return [], []
+            lo = 0 if start is None else bisect.bisect_left(sv.ts, start)
+            hi = sv.count if end is None else bisect.bisect_right(sv.ts, end)
+            return sv.ts[lo:hi].tolist(), sv.val[lo:hi].tolist()
+    except Exception:
+        return [], []
+
+def load_hist_tail(asset, metric, n):
+    """末尾 n 条 (timestamp, value)。"""
+    try:
+        with _SeriesView(asset, metric) as sv:
+            k = min(n, sv.count)
+            return list(zip(sv.ts[sv.count - k:].tolist(), sv.val[sv.count - k:].tolist()))
+    except Exception:
         return []
 
-def append_hist(asset, metric, value):
-    p = hist_path(asset, metric)
-    arr = []
-    if os.path.exists(p):
+def last_hist_ts(asset, metric):
+    tail = load_hist_tail(asset, metric, 1)
+    return tail[0][0] if tail else None
+
+def load_hist(asset, metric, days=90, now=None):
+    """最近 days 天（按时间戳，而非样本数）的历史值。"""
+    now = time.time() if now is None else now
+    return query_hist(asset, metric, start=now - days * 86400, end=now)[1]
+
+def append_hist(asset, metric, value, ts=None):
+    """
+    O(1) 追加一条记录。时间戳须单调不减（早于末条时按末条时间记录）；
+    若上次追加被中断导致两列长度差一条，先截断对齐（整体重写的中断由 _recover_series 处理）。
+    """
+    ts = time.time() if ts is None else ts
+    with hist_lock(asset, metric):
+        _recover_series(asset, metric)
+        _migrate_legacy_hist(asset, metric)
+        fds = {c: os.open(hist_path(asset, metric, c), os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644) for c in ("val", "ts")}
         try:
-            with open(p, "r") as f:
-                arr = json.load(f)
-        except:
-            arr = []
-    arr.append(value)
-    arr = arr[-180:]
-    with open(p, "w") as f:
-        json.dump(arr, f)
+            n = min(os.fstat(fd).st_size // HIST_COL.size for fd in fds.values())
+            for fd in fds.values():
+                if os.fstat(fd).st_size != n * HIST_COL.size:
+                    os.ftruncate(fd, n * HIST_COL.size)
+            if n:
+                last = HIST_COL.unpack(os.pread(fds["ts"], HIST_COL.size, (n - 1) * HIST_COL.size))[0]
+                ts = max(ts, last)
+            os.write(fds["val"], HIST_COL.pack(float(value)))
+            os.write(fds["ts"], HIST_COL.pack(float(ts)))
+        finally:
+            for fd in fds.values():
+                os.close(fd)
+    # 在锁外更新滚动统计（RollingStats 持锁时会读历史，避免锁顺序反转）
+    get_rolling().observe(asset, metric, ts, value)
+
+def merge_hist(asset, metric, points):
+    """
+    批量并入 [(t, v)]：与已有序列按时间合并（同一时间戳保留已有值）后整体重写一次。
+    返回新增点数。读取与重写在同一把锁内完成，期间的 append_hist 不会丢失；
+    重写中断后两列保持同一版本（见 _write_series），重跑即可补齐。
+    """
+    with hist_lock(asset, metric):
+        ts, vals = query_hist(asset, metric)
+        have = set(ts)
+        new = sorted((t, v) for t, v in points if t not in have)
+        if not new:
+            return 0
+        _write_series(asset, metric, sorted(list(zip(ts, vals)) + new))
+    return len(new)
+
+# --------------------
+# 滚动统计（每个 (asset, metric) 维护 ZSCORE_WINDOW_DAYS 天窗口内的 Welford 状态）
+# - append_hist 追加、窗口过期均为 O(1) 更新，z-score 无需再遍历历史
+# --------------------
+ZSCORE_WINDOW_DAYS = 90
+ROLLING_RESYNC_EVERY = 1000   # 每移除这么多点后精确重算一次，抑制浮点累积误差
+
+class RollingWindow:
+    def __init__(self, window_sec):
+        self.window_sec = window_sec
+        self.points = deque()
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self._removed = 0
+
+    def _add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    def _remove(self, x):
+        if self.n <= 1:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        self.n -= 1
+        d = x - self.mean
+        self.mean -= d / self.n
+        self.m2 = max(self.m2 - d * (x - self.mean), 0.0)
+        self._removed += 1
+
+    def _resync(self):
+        self.n, self.mean, self.m2, self._removed = 0, 0.0, 0.0, 0
+        for _, x in self.points:
+            self._add(x)
+
+    def push(self, ts, x):
+        self.points.append((ts, x))
+        self._add(x)
+        self.expire(ts)
+
+    def expire(self, now):
+        cutoff = now - self.window_sec
+        while self.points and self.points[0][0] < cutoff:
+            self._remove(self.points.popleft()[1])
+        if self._removed >= ROLLING_RESYNC_EVERY:
+            self._resync()
+
+    def stats(self):
+        """(n, mean, 总体标准差)，与 statistics.mean / pstdev 一致。"""
+        return self.n, self.mean, math.sqrt(self.m2 / self.n) if self.n else 0.0
+
+class RollingStats:
+    """
+    (asset, metric) -> RollingWindow。首次访问时从历史存储载入窗口；
+    若磁盘序列长度与已同步的长度不一致（其他进程写入或整体重写），自动重新载入。
+    """
+    def __init__(self, window_days=ZSCORE_WINDOW_DAYS):
+        self.window_sec = window_days * 86400
+        self._windows = {}
+        self._synced = {}
+        self._lock = threading.Lock()
+
+    def _disk_count(self, asset, metric):
+        p = hist_path(asset, metric, "ts")
+        return os.path.getsize(p) // HIST_COL.size if os.path.exists(p) else 0
+
+    def _window(self, asset, metric, now):
+        key = (asset, metric)
+        count = self._disk_count(asset, metric)
+        w = self._windows.get(key)
+        if w is None or self._synced.get(key) != count:
+            w = RollingWindow(self.window_sec)
+            for ts, x in zip(*query_hist(asset, metric, start=now - self.window_sec)):
+                w.points.append((ts, x))
+            w._resync()
+            self._windows[key] = w
+            self._synced[key] = count
+        w.expire(now)
+        return w
+
+    def observe(self, asset, metric, ts, value):
+        """append_hist 写盘后调用：已载入的窗口 O(1) 推入新点。"""
+        with self._lock:
+            key = (asset, metric)
+            w = self._windows.get(key)
+            if w is not None and self._synced.get(key) == self._disk_count(asset, metric) - 1:
+                w.push(ts, float(value))
+                self._synced[key] += 1
+
+    def window_stats(self, asset, metric, now=None):
+        with self._lock:
+            return self._window(asset, metric, time.time() if now is None else now).stats()
+
+@st.cache_resource
+def get_rolling() -> RollingStats:
+    return RollingStats()
 
 # --------------------
 # 通知：Gmail SMTP + Server酱（邮件标题简洁，邮件正文详细）
 # --------------------
+SMTP_IDLE_CHECK_SEC = 60   # 连接空闲超过该时长，发送前先 NOOP 探活
+
+class GmailSender:
+    """
+    复用一条 SMTP_SSL 连接：首封邮件时登录一次，同一轮的后续邮件走同一连接；
+    空闲较久先 NOOP 探活，连接已断则透明重连并重发一次。close() 在每轮结束时调用。
+    """
+    def __init__(self):
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"logins": 0, "sent": 0, "reconnects": 0}
+
+    def _drop(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+        self._server = None
+
+    def _alive(self):
+        if self._server is None:
+            return False
+        if time.time() - self._last_used < SMTP_IDLE_CHECK_SEC:
+            return True
+        try:
+            return self._server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def send(self, msg, to_addrs):
+        with self._lock:
+            for attempt in range(2):
+                if not self._alive():
+                    self._drop()
+                    server = smtplib.SMTP_SSL("smtp.gmail.com", 465, timeout=15)
+                    try:
+                        server.login(GMAIL_USER, GMAIL_APP_PASS)
+                    except Exception:
+                        try:
+                            server.close()
+                        except Exception:
+                            pass
+                        raise
+                    # 登录成功后才缓存连接，未登录的连接不会被后续发送复用
+                    self._server = server
+                    self.stats["logins"] += 1
+                try:
+                    self._server.sendmail(GMAIL_USER, to_addrs, msg.as_string())
+                except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                    self._server = None
+                    if attempt:
+                        raise
+                    self.stats["reconnects"] += 1
+                    continue
+                except Exception:
+                    # 其他 SMTP 错误（如 SMTPSenderRefused）：丢弃连接，下次重新登录
+                    self._drop()
+                    raise
+                self._last_used = time.time()
+                self.stats["sent"] += 1
+                return
+
+    def close(self):
+        with self._lock:
+            self._drop()
+
+@st.cache_resource
+def get_gmail() -> GmailSender:
+    return GmailSender()
+
 def send_email_gmail_shorttitle(subject_short, detailed_body):
     """
     subject_short: 简洁标题（如 "⚠️ BTC 过热警报"）
@@ -208,10 +1464,7 @@ def send_email_gmail_shorttitle(subject_short, detailed_body):
         msg["From"] = GMAIL_USER
         msg["To"] = ALERT_EMAIL_TO
         msg["Subject"] = Header(subject_short, "utf-8")
-        server = smtplib.SMTP_SSL("smtp.gmail.com", 465, timeout=15)
-        server.login(GMAIL_USER, GMAIL_APP_PASS)
-        server.sendmail(GMAIL_USER, [e.strip() for e in ALERT_EMAIL_TO.split(",")], msg.as_string())
-        server.quit()
+        get_gmail().send(msg, [e.strip() for e in ALERT_EMAIL_TO.split(",")])
         return True
     except Exception as e:
         st.error(f"邮件发送失败: {e}")
@@ -223,7 +1476,8 @@ def send_serverchan(title, content_md):
         return False
     url = f"https://sctapi.ftqq.com/{SERVERCHAN_SENDKEY}.send"
     try:
-        r = requests.post(url, data={"title": title, "desp": content_md}, timeout=10)
+        # POST 非幂等：仅在 429（未受理）或连接建立失败时重试，避免重复推送
+        r = get_http().request("POST", url, data={"title": title, "desp": content_md}, timeout=10, retry_status=(429,), retry_errors=(requests.ConnectTimeout,))
         if r.status_code == 200:
             return True
         else:
@@ -233,6 +1487,288 @@ def send_serverchan(title, content_md):
         st.warning(f"ServerChan 推送异常: {e}")
         return False
 
+# --------------------
+# 告警内容（简洁标题 + 详细正文；摘要模式下一轮所有告警合并为一条）
+# --------------------
+def alert_title(tag, sym, kind="new"):
+    suffix = "（升级）" if kind == "escalated" else ""
+    return f"{'⚠️' if tag=='OVERHEAT' else '🔔'} {sym} {'过热' if tag=='OVERHEAT' else '超跌'} 警报{suffix}"
+
+def render_alert_section(tag, rec) -> List[str]:
+    """单个资产的详细正文（多行）。"""
+    sym = rec["symbol"]
+    score = rec["score"]
+    lines = []
+    lines.append(alert_title(tag, sym, rec.get("alert_kind", "new")))
+    lines.append(f"时间: {rec['time']}")
+    if rec.get("alert_kind") == "escalated":
+        lines.append(f"状态: 告警持续且继续恶化（较上次通知 {rec['score'] - rec['prev_notified_score']:+.1f} 分）")
+    lines.append(f"资产: {sym}")
+    lines.append(f"当前价格（USD）: {rec['price']}")
+    lines.append(f"24h 价格变动 (%): {rec.get('price_change_24h_pct')}")
+    lines.append(f"Overheat Score: {score:.1f} (阈值: >={OVERHEAT_THRESHOLD} 为过热； <={OVERSOLD_THRESHOLD} 为超跌)")
+    lines.append("")
+    lines.append("主要指标（原始值）:")
+    for k, v in rec["metrics"].items():
+        lines.append(f"  - {k}: {v}")
+    lines.append("")
+    lines.append("贡献度（z-score）:")
+    for k, zval in rec["z"].items():
+        lines.append(f"  - {k}: {zval:+.3f}")
+    lines.append("")
+    # 简短建议（基于标签）
+    if tag == "OVERHEAT":
+        lines.append("简短建议：市场可能过热，短期回撤风险增加。可考虑审慎减仓或设置止盈/风险限额。")
+    else:
+        lines.append("简短建议：市场情绪偏弱/超跌，若基于长期投资，可考虑分批布局；短期波动风险较高。")
+    return lines
+
+def build_notifications(alerts) -> List[tuple]:
+    """
+    alerts -> [(title, body)]。ALERT_DIGEST 开启且有多个告警时合并为一条摘要：
+    标题列出全部资产与方向，正文先给概览，再按资产分节。
+    """
+    if not (ALERT_DIGEST and len(alerts) > 1):
+        return [(alert_title(tag, rec["symbol"], rec.get("alert_kind", "new")), "\n".join(render_alert_section(tag, rec))) for tag, rec in alerts]
+    parts = [f"{rec['symbol']} {'过热' if tag=='OVERHEAT' else '超跌'}{'↑' if rec.get('alert_kind') == 'escalated' else ''}" for tag, rec in alerts]
+    emoji = "⚠️" if any(tag == "OVERHEAT" for tag, _ in alerts) else "🔔"
+    title = f"{emoji} 市场情绪警报（{len(alerts)} 项）：{'、'.join(parts)}"
+    lines = [title, f"时间: {alerts[0][1]['time']}", "", "概览:"]
+    for tag, rec in alerts:
+        lines.append(f"  - {rec['symbol']}: {'过热' if tag=='OVERHEAT' else '超跌'}，Overheat Score {rec['score']:.1f}，价格 {rec['price']} USD")
+    for tag, rec in alerts:
+        lines.append("")
+        lines.append("=" * 24)
+        lines.extend(render_alert_section(tag, rec))
+    return [(title, "\n".join(lines))]
+
+# --------------------
+# 告警状态机（每个 (资产, 方向) 一个状态，持久化到 HIST_DIR）
+# - 进入：过热 score >= OVERHEAT_THRESHOLD / 超跌 score <= OVERSOLD_THRESHOLD
+# - 退出：需回落超过 ALERT_HYSTERESIS 分（滞回带，避免在阈值附近反复触发）
+# - 冷却：距上次通知不足 ALERT_COOLDOWN_MIN 分钟的重新进入不再通知
+# - 升级：告警持续期间，程度较上次通知再恶化 ALERT_ESCALATION_STEP 分时再通知一次
+# --------------------
+ALERT_STATE_PATH = os.path.join(HIST_DIR, "alert_state.json")
+ALERT_HYSTERESIS = float(get_secret("ALERT_HYSTERESIS", 5.0))
+ALERT_COOLDOWN_MIN = float(get_secret("ALERT_COOLDOWN_MIN", 720))
+ALERT_ESCALATION_STEP = float(get_secret("ALERT_ESCALATION_STEP", 10.0))
+_alert_state_lock = threading.Lock()
+
+def load_alert_state() -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(ALERT_STATE_PATH, "r") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_alert_state(state):
+    with open(ALERT_STATE_PATH + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(ALERT_STATE_PATH + ".tmp", ALERT_STATE_PATH)
+
+def step_alert_state(s: Dict[str, Any], tag, score, now):
+    """
+    推进单个状态，返回 None / "new" / "escalated"。
+    severity 统一为"越大越极端"：过热取 score，超跌取 100 - score。
+    """
+    if tag == "OVERHEAT":
+        enter, leave, severity = score >= OVERHEAT_THRESHOLD, score < OVERHEAT_THRESHOLD - ALERT_HYSTERESIS, score
+    else:
+        enter, leave, severity = score <= OVERSOLD_THRESHOLD, score > OVERSOLD_THRESHOLD + ALERT_HYSTERESIS, 100 - score
+    s["last_score"] = score
+    if not s.get("active"):
+        if not enter:
+            return None
+        s.update(active=True, since=now)
+        cooled = s.get("last_sent") is None or now - s["last_sent"] >= ALERT_COOLDOWN_MIN * 60
+        s["notified_severity"] = severity
+        if cooled:
+            s["last_sent"] = now
+            return "new"
+        return None
+    if leave:
+        s["active"] = False
+        return None
+    if severity - s.get("notified_severity", severity) >= ALERT_ESCALATION_STEP:
+        s.update(notified_severity=severity, last_sent=now)
+        return "escalated"
+    return None
+
+def update_alert_states(results, now=None) -> List[tuple]:
+    """用本轮结果推进状态机，返回需要通知的 [(tag, rec)]（rec 附带 alert_kind）。"""
+    now = time.time() if now is None else now
+    out = []
+    with _alert_state_lock:
+        state = load_alert_state()
+        for rec in results:
+            for tag in ("OVERHEAT", "OVERSOLD"):
+                s = state.setdefault(f"{rec['symbol']}:{tag}", {})
+                prev = s.get("notified_severity")
+                kind = step_alert_state(s, tag, rec["score"], now)
+                if kind:
+                    extra = {"alert_kind": kind}
+                    if kind == "escalated":
+                        extra["prev_notified_score"] = prev if tag == "OVERHEAT" else 100 - prev
+                    out.append((tag, dict(rec, **extra)))
+        save_alert_state(state)
+    return out
+
+def dispatch_alerts(alerts):
+    """放入通知队列后立即返回，实际发送由后台线程完成。"""
+    for title, detailed_body in build_notifications(alerts):
+        get_notifier().enqueue(title, detailed_body)
+
+# --------------------
+# 通知投递队列（后台线程发送，检测流程不再阻塞在 SMTP / Server酱 上）
+# - 每条通知先写入磁盘 outbox，投递成功后删除；进程重启后未完成的通知会重新入队
+# - 按渠道记录进度：邮件已发、微信失败时只重试微信；失败按带抖动的指数退避重试
+# --------------------
+OUTBOX_DIR = os.path.join(HIST_DIR, "outbox")
+NOTIFY_WORKERS = 2
+NOTIFY_MAX_ATTEMPTS = int(get_secret("NOTIFY_MAX_ATTEMPTS", 6))
+NOTIFY_BACKOFF_BASE = 30.0
+NOTIFY_BACKOFF_MAX = 1800.0
+
+NOTIFY_CHANNELS = {
+    # 渠道 -> (是否已配置, 发送函数)
+    "email": (lambda: bool(GMAIL_USER and GMAIL_APP_PASS and ALERT_EMAIL_TO),
+              lambda m: send_email_gmail_shorttitle(m["title"], m["body"])),
+    # ServerChan 正文用代码块包裹，便于微信阅读
+    "serverchan": (lambda: bool(SERVERCHAN_SENDKEY),
+                   lambda m: send_serverchan(m["title"], "```\n" + m["body"] + "\n```")),
+}
+
+class NotificationQueue:
+    def __init__(self):
+        os.makedirs(os.path.join(OUTBOX_DIR, "failed"), exist_ok=True)
+        self._q = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._inflight = set()   # 已排队或投递中的通知 id，防止同一通知被重复排队
+        self.stats = {"enqueued": 0, "delivered": 0, "retries": 0, "failed": 0}
+
+    def _path(self, msg_id):
+        return os.path.join(OUTBOX_DIR, f"{msg_id}.json")
+
+    def _save(self, msg):
+        p = self._path(msg["id"])
+        with open(p + ".tmp", "w") as f:
+            json.dump(msg, f, ensure_ascii=False)
+        os.replace(p + ".tmp", p)
+
+    def _submit(self, msg_id):
+        with self._lock:
+            if msg_id in self._inflight:
+                return
+            self._inflight.add(msg_id)
+        self._q.put(msg_id)
+
+    def _schedule(self, msg_id, delay):
+        if delay <= 0:
+            self._submit(msg_id)
+            return
+        t = threading.Timer(delay, self._submit, args=(msg_id,))
+        t.daemon = True
+        t.start()
+
+    def start(self):
+        """启动工作线程，并把 outbox 中遗留的通知重新排期。"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for name in sorted(os.listdir(OUTBOX_DIR)):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(OUTBOX_DIR, name), "r") as f:
+                        msg = json.load(f)
+                    self._schedule(msg["id"], msg.get("next_try", 0) - time.time())
+                except Exception:
+                    pass
+        for i in range(NOTIFY_WORKERS):
+            threading.Thread(target=self._worker, name=f"notify-{i}", daemon=True).start()
+
+    def enqueue(self, title, body):
+        pending = []
+        for ch, (configured, send) in NOTIFY_CHANNELS.items():
+            if configured():
+                pending.append(ch)
+            else:
+                send({"title": title, "body": body})  # 未配置：沿用原有的跳过提示
+        if not pending:
+            return None
+        # 先启动（重新排期 outbox 遗留通知），再落盘新通知，避免启动扫描把它再排一次
+        self.start()
+        msg = {"id": f"{time.time_ns()}-{random.getrandbits(32):08x}", "title": title, "body": body,
+               "pending": pending, "attempts": 0, "next_try": 0, "created": now_utc_str()}
+        self._save(msg)
+        with self._lock:
+            self.stats["enqueued"] += 1
+        self._submit(msg["id"])
+        return msg["id"]
+
+    def _deliver(self, msg_id):
+        """投递一次；需要重试时返回延迟秒数，否则返回 None。"""
+        try:
+            with open(self._path(msg_id), "r") as f:
+                msg = json.load(f)
+        except Exception:
+            return None
+        remaining = []
+        for ch in msg["pending"]:
+            try:
+                ok = NOTIFY_CHANNELS[ch][1](msg)
+            except Exception:
+                ok = False
+            if not ok:
+                remaining.append(ch)
+        if not remaining:
+            os.remove(self._path(msg_id))
+            with self._lock:
+                self.stats["delivered"] += 1
+            return None
+        msg["pending"] = remaining
+        msg["attempts"] += 1
+        if msg["attempts"] >= NOTIFY_MAX_ATTEMPTS:
+            self._save(msg)
+            os.replace(self._path(msg_id), os.path.join(OUTBOX_DIR, "failed", f"{msg_id}.json"))
+            with self._lock:
+                self.stats["failed"] += 1
+            return None
+        delay = min(NOTIFY_BACKOFF_MAX, NOTIFY_BACKOFF_BASE * 2 ** (msg["attempts"] - 1)) * random.uniform(0.5, 1.0)
+        msg["next_try"] = time.time() + delay
+        self._save(msg)
+        with self._lock:
+            self.stats["retries"] += 1
+        return delay
+
+    def _worker(self):
+        while True:
+            msg_id = self._q.get()
+            delay = None
+            try:
+                delay = self._deliver(msg_id)
+            except Exception:
+                pass   # 单条通知异常不影响工作线程；文件仍在 outbox，下次启动时重新排期
+            finally:
+                with self._lock:
+                    self._inflight.discard(msg_id)
+                if delay is not None:
+                    self._schedule(msg_id, delay)
+                with self._lock:
+                    idle = not self._inflight
+            if idle:
+                # 队列已清空，登出 SMTP（下一封邮件时重新登录）
+                get_gmail().close()
+
+    def pending_count(self):
+        return sum(1 for n in os.listdir(OUTBOX_DIR) if n.endswith(".json"))
+
+@st.cache_resource
+def get_notifier() -> NotificationQueue:
+    return NotificationQueue()
+
 # --------------------
 # 单次检测流程（返回检测记录）
 # --------------------
@@ -240,139 +1776,628 @@ def single_check():
     t = now_utc_str()
     alerts = []
     results = []
-    for sym, cg_id in ASSETS.items():
-        price_info = fetch_price_coingecko(cg_id)
-        metrics = {
-            "etf_netflow": fetch_etf_netflow(sym),
-            "exchange_netflow": fetch_exchange_flow(sym),
-            "oi_change_pct": fetch_oi_change_pct(sym),
-            "funding_rate": fetch_funding_rate(sym),
-            "whale_count": fetch_whale_count(sym, threshold_amount=100 if sym == "BTC" else 1000),
-            "reserve_change_pct": fetch_reserve_change_pct(sym)
-        }
-        # 历史载入并附加当前值（用于 z-score）
-        hist_stats = {}
+    # 价格（一次批量请求）与全部链上指标并发抓取；价格同样受 FETCH_DEADLINE_SEC 约束
+    started = time.monotonic()
+    ex = ThreadPoolExecutor(max_workers=1, thread_name_prefix="price")
+    price_fut = ex.submit(current_prices)
+    all_metrics = fetch_all_metrics(list(ASSETS))
+    try:
+        prices = price_fut.result(timeout=max(FETCH_DEADLINE_SEC - (time.monotonic() - started), 0.0))
+    except FuturesTimeout:
+        st.warning(f"价格抓取未在 {FETCH_DEADLINE_SEC:.0f}s 内返回，本轮价格按缺失处理。")
+        prices = {cg_id: {"price": None, "price_change_24h_pct": None} for cg_id in ASSETS.values()}
+    except Exception:
+        prices = {cg_id: {"price": None, "price_change_24h_pct": None} for cg_id in ASSETS.values()}
+    ex.shutdown(wait=False, cancel_futures=True)
+    get_price_watch().mark_check(prices)
+    # 先基于窗口内历史一次性算出所有资产的 z-score 与分数，再追加当前值
+    scores, zmat = score_assets(list(ASSETS.values()), [all_metrics[sym] for sym in ASSETS])
+    for i, (sym, cg_id) in enumerate(ASSETS.items()):
+        price_info = prices[cg_id]
+        metrics = all_metrics[sym]
+        score = float(scores[i])
+        z = {k: float(zmat[i, j]) for j, k in enumerate(METRIC_NAMES)}
         for k, v in metrics.items():
-            h = load_hist(cg_id, k, days=90)
-            hist_stats[k] = h
             append_hist(cg_id, k, v)
-        score, z = compute_overheat_score(metrics, hist_stats)
+        if price_info.get("price") is not None:
+            append_hist(cg_id, PRICE_SERIES, price_info["price"])
         rec = {"time": t, "symbol": sym, "price": price_info.get("price"), "price_change_24h_pct": price_info.get("price_change_24h_pct"), "score": score, "metrics": metrics, "z": z}
         results.append(rec)
         if score >= OVERHEAT_THRESHOLD:
             alerts.append(("OVERHEAT", rec))
         elif score <= OVERSOLD_THRESHOLD:
             alerts.append(("OVERSOLD", rec))
-    # 若存在告警，发送通知
-    if alerts:
-        # 针对每个告警形成简洁标题 + 详细正文
-        for tag, rec in alerts:
-            sym = rec["symbol"]
-            score = rec["score"]
-            # 简洁标题（中文）
-            title = f"{'⚠️' if tag=='OVERHEAT' else '🔔'} {sym} {'过热' if tag=='OVERHEAT' else '超跌'} 警报"
-            # 详细正文（多行）
-            lines = []
-            lines.append(f"{title}")
-            lines.append(f"时间: {rec['time']}")
-            lines.append(f"资产: {sym}")
-            lines.append(f"当前价格（USD）: {rec['price']}")
-            lines.append(f"24h 价格变动 (%): {rec.get('price_change_24h_pct')}")
-            lines.append(f"Overheat Score: {score:.1f} (阈值: >={OVERHEAT_THRESHOLD} 为过热； <={OVERSOLD_THRESHOLD} 为超跌)")
-            lines.append("")
-            lines.append("主要指标（原始值）:")
-            for k, v in rec["metrics"].items():
-                lines.append(f"  - {k}: {v}")
-            lines.append("")
-            lines.append("贡献度（z-score）:")
-            for k, zval in rec["z"].items():
-                lines.append(f"  - {k}: {zval:+.3f}")
-            lines.append("")
-            # 简短建议（基于标签）
-            if tag == "OVERHEAT":
-                lines.append("简短建议：市场可能过热，短期回撤风险增加。可考虑审慎减仓或设置止盈/风险限额。")
-            else:
-                lines.append("简短建议：市场情绪偏弱/超跌，若基于长期投资，可考虑分批布局；短期波动风险较高。")
-            detailed_body = "\n".join(lines)
-            # 发送邮件（简短标题 + 详细正文）
-            send_email_gmail_shorttitle(title, detailed_body)
-            # 发送 ServerChan（正文用代码块包裹，便于微信阅读）
-            send_serverchan(title, "```\n" + detailed_body + "\n```")
+    # 经状态机过滤：只通知新进入告警区间或持续恶化（升级）的资产
+    to_notify = update_alert_states(results)
+    if to_notify:
+        dispatch_alerts(to_notify)
     # 保存上次运行记录供 UI 展示
     with open(os.path.join(HIST_DIR, "last_run.json"), "w") as f:
         json.dump({"time": t, "results": results, "alerts": [a[1] for a in alerts]}, f)
     return {"time": t, "results": results, "alerts": alerts}
 
 # --------------------
-# 调度器（固定每 180 分钟）
+# 历史回填（一次请求拉取每个指标的完整 Glassnode 序列，批量写入历史存储）
+# - 可重复执行：只请求本地尚未覆盖的头部 [since, 首条) 与尾部 (末条, now] 区间
 # --------------------
-scheduler = BackgroundScheduler()
-atexit.register(lambda: scheduler.shutdown(wait=False) if scheduler.running else None)
+BACKFILL_DAYS = 365
+BACKFILL_INTERVAL = "24h"
+INTERVAL_SEC = {"10m": 600, "1h": 3600, "24h": 86400, "1w": 7 * 86400}
 
-def start_scheduler():
+def missing_ranges(asset, metric, since, until, step):
+    """返回 [since, until] 中本地序列尚未覆盖的区间（至多头尾两段）。"""
+    ts, _ = query_hist(asset, metric, start=since, end=until)
+    if not ts:
+        return [(since, until)]
+    out = []
+    if ts[0] - since >= step:
+        out.append((since, ts[0] - 1))
+    if until - ts[-1] >= step:
+        out.append((ts[-1] + 1, until))
+    return out
+
+def backfill_history(days=BACKFILL_DAYS, interval=BACKFILL_INTERVAL, log=print):
+    """
+    回填最近 days 天：价格（CoinGecko，回测计算远期收益用）、GLASSNODE_METRICS
+    以及由原始序列计算的 DERIVED_PCT_METRICS。返回 {(sym, metric): 新增点数}。
+    """
+    until = time.time()
+    since = until - days * 86400
+    step = INTERVAL_SEC.get(interval, 86400)
+    added = {}
+    for sym, cg_id in ASSETS.items():
+        n = 0
+        for s, u in missing_ranges(cg_id, PRICE_SERIES, since, until, step):
+            n += merge_hist(cg_id, PRICE_SERIES, fetch_price_history_coingecko(cg_id, s, u))
+        added[(sym, PRICE_SERIES)] = n
+        log(f"{sym} {PRICE_SERIES}: 新增 {n} 条")
+    if not GLASSNODE_API_KEY:
+        log("未配置 GLASSNODE_API_KEY，跳过链上指标回填。")
+        return added
+    for sym, cg_id in ASSETS.items():
+        for name, path in GLASSNODE_METRICS.items():
+            n = 0
+            for s, u in missing_ranges(cg_id, name, since, until, step):
+                n += merge_hist(cg_id, name, glassnode_series(path, sym, since=s, until=u, interval=interval))
+            added[(sym, name)] = n
+            log(f"{sym} {name}: 新增 {n} 条")
+        # 派生指标：先补齐原始序列（多取一个变化率窗口），再由原始序列批量算出变化率历史
+        for name, (path, series, window_days) in DERIVED_PCT_METRICS.items():
+            for s, u in missing_ranges(cg_id, series, since - window_days * 86400, until, step):
+                merge_hist(cg_id, series, glassnode_series(path, sym, since=s, until=u, interval=interval))
+            pts = [(t, v) for t, v in pct_change_series(*query_hist(cg_id, series), window_days) if t >= since]
+            added[(sym, name)] = merge_hist(cg_id, name, pts)
+            log(f"{sym} {name}: 新增 {added[(sym, name)]} 条")
+    return added
+
+# --------------------
+# 离线回测（把已存储的指标与价格历史重采样到等间隔时间轴，整条时间线一次性向量化评分）
+# --------------------
+BACKTEST_STEP_SEC = 86400
+BACKTEST_HORIZONS_DAYS = (1, 7, 30)
+
+def asof_align(ts, vals, grid) -> np.ndarray:
+    """as-of 对齐：grid 上每个时间点取 <= 该时间的最近一个值，此前无数据为 NaN。"""
+    ts, vals = np.asarray(ts, dtype=float), np.asarray(vals, dtype=float)
+    if ts.size == 0:
+        return np.full(len(grid), np.nan)
+    idx = np.searchsorted(ts, grid, side="right") - 1
+    return np.where(idx >= 0, vals[np.clip(idx, 0, None)], np.nan)
+
+def rolling_zscores(x: np.ndarray, window: int) -> np.ndarray:
+    """
+    (T, M) 序列的滚动 z-score：t 时刻用 [t-window, t) 的有效值（不含当前值，与线上先评分后追加一致），
+    通过累加和一次算出整条时间线。样本数 < 2、标准差为 0 或当前值缺失处为 0。
+    """
+    valid = ~np.isnan(x)
+    center = np.where(valid, x, 0.0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)  # 去中心化，减小累加误差
+    xc = np.where(valid, x - center, 0.0)
+    pad = np.zeros((1, x.shape[1]))
+    c1 = np.concatenate([pad, np.cumsum(xc, axis=0)])
+    c2 = np.concatenate([pad, np.cumsum(xc * xc, axis=0)])
+    cn = np.concatenate([pad, np.cumsum(valid, axis=0)])
+    hi = np.arange(x.shape[0])
+    lo = np.clip(hi - window, 0, None)
+    n = cn[hi] - cn[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mu = (c1[hi] - c1[lo]) / n
+        sigma = np.sqrt(np.clip((c2[hi] - c2[lo]) / n - mu * mu, 0.0, None))
+    z = zscores_from_stats(xc, n, mu, sigma)
+    return np.where(valid, z, 0.0)
+
+def load_backtest_inputs(asset_ids=None, days=None, step=BACKTEST_STEP_SEC, window_days=ZSCORE_WINDOW_DAYS, horizons=BACKTEST_HORIZONS_DAYS):
+    """
+    读取历史存储并预计算回测所需矩阵（与权重/阈值无关，可供多组参数复用）：
+    z: (A, T, M) 每个时间点的 z-score；fwd: (A, H, T) 各持有期的远期收益。
+    """
+    asset_ids = list(ASSETS.values()) if asset_ids is None else list(asset_ids)
+    prices = {a: query_hist(a, PRICE_SERIES) for a in asset_ids}
+    starts = [ts[0] for ts, _ in prices.values() if ts]
+    if not starts:
+        raise ValueError("没有价格历史，请先运行 backfill 或等待定时检测积累数据。")
+    end = max(ts[-1] for ts, _ in prices.values() if ts)
+    start = min(starts) if days is None else max(min(starts), end - days * 86400)
+    grid = np.arange(math.floor(start / step) * step + step, end + 1, step, dtype=float)
+    if len(grid) == 0:
+        raise ValueError("价格历史不足一个回测步长。")
+    window = max(int(window_days * 86400 // step), 2)
+    # 评分窗口需要 grid 起点之前的历史：在前面补 window 个点，算完 z-score 后截掉
+    ext = np.concatenate([grid[0] - step * np.arange(window, 0, -1), grid])
+    z = np.zeros((len(asset_ids), len(grid), len(METRIC_NAMES)))
+    price = np.full((len(asset_ids), len(grid)), np.nan)
+    for i, a in enumerate(asset_ids):
+        price[i] = asof_align(*prices[a], grid)
+        raw = np.column_stack([asof_align(*query_hist(a, k), ext) for k in METRIC_NAMES])
+        z[i] = rolling_zscores(raw, window)[window:]
+    fwd = np.full((len(asset_ids), len(horizons), len(grid)), np.nan)
+    for h, days_h in enumerate(horizons):
+        k = int(round(days_h * 86400 / step))
+        if 0 < k < len(grid):
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fwd[:, h, :-k] = price[:, k:] / price[:, :-k] - 1.0
+    return {"assets": asset_ids, "grid": grid, "z": z, "price": price, "fwd": fwd, "horizons": tuple(horizons)}
+
+def backtest_stats(scores: np.ndarray, fwd: np.ndarray, horizons, overheat, oversold) -> Dict[str, Any]:
+    """
+    scores: (A, T)；fwd: (A, H, T)。统计触发次数与各持有期的平均远期收益、命中率
+    （OVERHEAT 之后下跌、OVERSOLD 之后上涨视为命中）。
+    """
+    report = {}
+    for tag, mask, sign in (("OVERHEAT", scores >= overheat, -1.0), ("OVERSOLD", scores <= oversold, 1.0)):
+        by_h = {}
+        for h, days_h in enumerate(horizons):
+            r = fwd[:, h, :][mask]
+            r = r[~np.isnan(r)]
+            by_h[f"{days_h}d"] = {
+                "n": int(r.size),
+                "mean_return": float(r.mean()) if r.size else None,
+                "hit_rate": float((sign * r > 0).mean()) if r.size else None,
+            }
+        report[tag] = {"triggers": int(mask.sum()), "by_horizon": by_h}
+    return report
+
+def run_backtest(inputs, weights: Dict[str, float] = None, overheat=None, oversold=None) -> Dict[str, Any]:
+    overheat = OVERHEAT_THRESHOLD if overheat is None else overheat
+    oversold = OVERSOLD_THRESHOLD if oversold is None else oversold
+    scores = vectorized_scores(inputs["z"], weights)
+    report = backtest_stats(scores, inputs["fwd"], inputs["horizons"], overheat, oversold)
+    report["per_asset"] = {a: backtest_stats(scores[i:i + 1], inputs["fwd"][i:i + 1], inputs["horizons"], overheat, oversold) for i, a in enumerate(inputs["assets"])}
+    report["steps"] = int(len(inputs["grid"]))
+    return report
+
+# --------------------
+# 参数优化（网格 / 随机搜索权重与阈值，候选在进程池中批量评估）
+# - z-score 与远期收益矩阵只预计算一次，经 initializer 下发给每个工作进程，所有候选共用
+# - 按时间切分：前段（训练区间）选参，最后 OPT_HOLDOUT_FRAC 的样本外区间只用于检验；
+#   训练区间末尾远期收益会跨入样本外区间的点被剔除。样本外不达标时不写参数文件
+# --------------------
+OPT_HORIZON_DAYS = 7
+OPT_MIN_TRIGGERS = 10
+OPT_HOLDOUT_FRAC = 0.25
+OPT_HOLDOUT_MIN_TRIGGERS = 5
+OPT_BATCH = 256
+OPT_WEIGHT_GRID = (0.05, 0.15, 0.30)
+OPT_OVERHEAT_GRID = (55.0, 60.0, 65.0, 70.0)
+OPT_OVERSOLD_GRID = (25.0, 30.0, 35.0, 40.0)
+
+_OPT_INPUTS = {}
+
+def _opt_init(z, fwd):
+    _OPT_INPUTS["z"], _OPT_INPUTS["fwd"] = z, fwd
+
+def _opt_eval_batch(candidates):
+    return evaluate_candidates(_OPT_INPUTS["z"], _OPT_INPUTS["fwd"], candidates)
+
+def evaluate_candidates(z, fwd, candidates, min_triggers=OPT_MIN_TRIGGERS):
+    """
+    一批候选：z (A, T, M) @ W.T 一次得到 (A, T, K) 分数，再逐候选按阈值统计。
+    目标函数为触发后远期收益的平均"方向正确"收益（过热取 -r，超跌取 +r）。
+    """
+    W = np.array([[c["weights"][k] for k in METRIC_NAMES] for c in candidates])
+    scores = normalize_scores(z @ W.T)
+    out = []
+    for j, c in enumerate(candidates):
+        sc = scores[..., j]
+        over = fwd[(sc >= c["overheat_threshold"]) & ~np.isnan(fwd)]
+        under = fwd[(sc <= c["oversold_threshold"]) & ~np.isnan(fwd)]
+        signed = np.concatenate([-over, under])
+        n = int(signed.size)
+        objective = float(signed.mean()) if n >= min_triggers else float("-inf")
+        out.append(dict(c, objective=objective, triggers=n, hit_rate=float((signed > 0).mean()) if n else None))
+    return out
+
+def _normalize_weights(mags):
+    """幅度归一化为绝对值之和为 1，符号沿用 METRIC_WEIGHTS。"""
+    total = sum(mags) or 1.0
+    return {k: math.copysign(m / total, METRIC_WEIGHTS[k] or 1.0) for k, m in zip(METRIC_NAMES, mags)}
+
+def optimizer_candidates(method="random", samples=2000, seed=0):
+    if method == "grid":
+        for mags in itertools.product(OPT_WEIGHT_GRID, repeat=len(METRIC_NAMES)):
+            for oh in OPT_OVERHEAT_GRID:
+                for os_ in OPT_OVERSOLD_GRID:
+                    yield {"weights": _normalize_weights(mags), "overheat_threshold": oh, "oversold_threshold": os_}
+        return
+    rng = np.random.default_rng(seed)
+    for _ in range(samples):
+        yield {
+            "weights": _normalize_weights(rng.dirichlet(np.ones(len(METRIC_NAMES))).tolist()),
+            "overheat_threshold": float(rng.uniform(min(OPT_OVERHEAT_GRID), max(OPT_OVERHEAT_GRID))),
+            "oversold_threshold": float(rng.uniform(min(OPT_OVERSOLD_GRID), max(OPT_OVERSOLD_GRID))),
+        }
+
+def split_holdout(z, fwd, horizon_steps, holdout_frac=OPT_HOLDOUT_FRAC):
+    """按时间切分为 (训练 z, 训练 fwd, 样本外 z, 样本外 fwd)；训练区间最后 horizon_steps 个点的远期收益置为 NaN。"""
+    T = z.shape[1]
+    split = int(T * (1 - holdout_frac))
+    if split <= horizon_steps or split >= T:
+        raise ValueError(f"历史过短（{T} 个回测步长），无法在 {horizon_steps} 步持有期下划分训练 / 样本外区间。")
+    fwd_train = fwd[:, :split].copy()
+    fwd_train[:, split - horizon_steps:] = np.nan
+    return z[:, :split], fwd_train, z[:, split:], fwd[:, split:]
+
+def optimize_score_params(method="random", samples=2000, days=None, horizon_days=OPT_HORIZON_DAYS, workers=None, seed=0, output=SCORE_CONFIG_PATH, holdout_frac=OPT_HOLDOUT_FRAC, log=print):
+    inputs = load_backtest_inputs(days=days, horizons=(horizon_days,))
+    horizon_steps = int(round(horizon_days * 86400 / BACKTEST_STEP_SEC))
+    z, fwd, z_test, fwd_test = split_holdout(inputs["z"], inputs["fwd"][:, 0, :], horizon_steps, holdout_frac)
+    batch, futures = [], []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_opt_init, initargs=(z, fwd)) as pool:
+        for c in optimizer_candidates(method, samples, seed):
+            batch.append(c)
+            if len(batch) >= OPT_BATCH:
+                futures.append(pool.submit(_opt_eval_batch, batch))
+                batch = []
+        if batch:
+            futures.append(pool.submit(_opt_eval_batch, batch))
+        results = [r for f in futures for r in f.result()]
+    best = max(results, key=lambda r: r["objective"])
+    log(f"评估 {len(results)} 组候选，训练区间最佳目标值 {best['objective']:.4f}（触发 {best['triggers']} 次，命中率 {best['hit_rate']}）")
+    if best["objective"] == float("-inf"):
+        log(f"没有候选达到最少 {OPT_MIN_TRIGGERS} 次触发，未写入参数文件。")
+        return best
+    test = evaluate_candidates(z_test, fwd_test, [best], min_triggers=OPT_HOLDOUT_MIN_TRIGGERS)[0]
+    best["holdout"] = {"objective": test["objective"], "triggers": test["triggers"], "hit_rate": test["hit_rate"]}
+    log(f"样本外（最后 {holdout_frac:.0%}）目标值 {test['objective']:.4f}（触发 {test['triggers']} 次，命中率 {test['hit_rate']}）")
+    if not test["objective"] > 0:
+        log(f"样本外未通过检验（需至少 {OPT_HOLDOUT_MIN_TRIGGERS} 次触发且平均方向收益为正），未写入参数文件。")
+        return best
+    cfg = {
+        "weights": best["weights"],
+        "overheat_threshold": best["overheat_threshold"],
+        "oversold_threshold": best["oversold_threshold"],
+        "objective": best["objective"],
+        "triggers": best["triggers"],
+        "hit_rate": best["hit_rate"],
+        "holdout": best["holdout"],
+        "horizon_days": horizon_days,
+        "method": method,
+        "generated_at": now_utc_str(),
+    }
+    with open(output, "w") as f:
+        json.dump(cfg, f, ensure_ascii=False, indent=2)
+    log(f"已写入 {output}，重启应用后生效。")
+    return best
+
+def cli(argv):
+    parser = argparse.ArgumentParser(prog="app.py", description="BTC/ETH 市场情绪监控器命令行工具")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_bf = sub.add_parser("backfill", help="从 Glassnode 回填历史指标")
+    p_bf.add_argument("--days", type=int, default=BACKFILL_DAYS)
+    p_bf.add_argument("--interval", default=BACKFILL_INTERVAL, choices=sorted(INTERVAL_SEC))
+    p_bt = sub.add_parser("backtest", help="用已存储历史回测当前权重与阈值")
+    p_bt.add_argument("--days", type=int, default=None, help="只回测最近 N 天（默认全部历史）")
+    p_bt.add_argument("--overheat", type=float, default=OVERHEAT_THRESHOLD)
+    p_bt.add_argument("--oversold", type=float, default=OVERSOLD_THRESHOLD)
+    p_opt = sub.add_parser("optimize", help="搜索权重与阈值，并写入评分参数文件")
+    p_opt.add_argument("--method", choices=("random", "grid"), default="random")
+    p_opt.add_argument("--samples", type=int, default=2000, help="随机搜索的候选数")
+    p_opt.add_argument("--days", type=int, default=None)
+    p_opt.add_argument("--horizon", type=int, default=OPT_HORIZON_DAYS, help="目标函数使用的远期收益天数")
+    p_opt.add_argument("--workers", type=int, default=None)
+    p_opt.add_argument("--seed", type=int, default=0)
+    p_opt.add_argument("--output", default=SCORE_CONFIG_PATH)
+    p_opt.add_argument("--holdout", type=float, default=OPT_HOLDOUT_FRAC, help="最后这部分历史作为样本外检验区间（比例）")
+    args = parser.parse_args(argv)
     try:
-        scheduler.remove_all_jobs()
-    except:
-        pass
-    # 使用固定 180 分钟（3 小时）
-    scheduler.add_job(single_check, 'interval', minutes=FIXED_INTERVAL_MIN, id="crypto_overheat_job", next_run_time=None)
-    scheduler.start()
+        if args.cmd == "optimize":
+            optimize_score_params(method=args.method, samples=args.samples, days=args.days, horizon_days=args.horizon, workers=args.workers, seed=args.seed, output=args.output, holdout_frac=args.holdout)
+        elif args.cmd == "backfill":
+            backfill_history(days=args.days, interval=args.interval)
+        elif args.cmd == "backtest":
+            report = run_backtest(load_backtest_inputs(days=args.days), overheat=args.overheat, oversold=args.oversold)
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+    except ValueError as e:
+        # 数据不足等可预期的问题：只输出原因，不打印堆栈
+        print(f"错误：{e}", file=sys.stderr)
+        return 1
+    return 0
+
+# --------------------
+# 事件驱动告警（价格流上的滑动窗口规则）
+# - PRICE_EVENT_WINDOW_MIN 分钟内价格相对窗口最低 / 最高点涨跌超过 PRICE_EVENT_MOVE_PCT% 时，
+#   立即用（响应缓存中的）链上指标对该资产重新评分，并推送一条价格异动通知
+# - 窗口最小 / 最大值由单调队列维护，每条报价均摊 O(1)
+# - 完整检测正在运行 / 已排队，或窗口内已由价格波动触发过时不再推送异动通知（由完整检测统一通知）
+# --------------------
+PRICE_EVENT_ENABLED = get_bool_secret("PRICE_EVENT_ENABLED", True)
+PRICE_EVENT_WINDOW_MIN = float(get_secret("PRICE_EVENT_WINDOW_MIN", 15))
+PRICE_EVENT_MOVE_PCT = float(get_secret("PRICE_EVENT_MOVE_PCT", 3.0))
+PRICE_EVENT_COOLDOWN_MIN = float(get_secret("PRICE_EVENT_COOLDOWN_MIN", 60))
+PRICE_EVENT_WORKERS = 2
+
+class MonotonicWindow:
+    """时间窗口内的滑动最小值 / 最大值：_min 递增、_max 递减，队首即为窗口极值。"""
+    def __init__(self, window_sec):
+        self.window_sec = window_sec
+        self._min = deque()
+        self._max = deque()
+
+    def push(self, ts, x):
+        while self._min and self._min[-1][1] >= x:
+            self._min.pop()
+        self._min.append((ts, x))
+        while self._max and self._max[-1][1] <= x:
+            self._max.pop()
+        self._max.append((ts, x))
+        cutoff = ts - self.window_sec
+        while self._min[0][0] < cutoff:
+            self._min.popleft()
+        while self._max[0][0] < cutoff:
+            self._max.popleft()
+
+    def min(self):
+        return self._min[0][1]
+
+    def max(self):
+        return self._max[0][1]
+
+class PriceRuleEngine:
+    def __init__(self):
+        self._windows = {}
+        self._last_fired = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=PRICE_EVENT_WORKERS, thread_name_prefix="price-event")
+        self.stats = {"ticks": 0, "events": 0, "suppressed": 0}
+
+    def on_tick(self, sym, ts, price):
+        """处理一条报价；触发时在有界线程池中执行重评分与通知，不阻塞价格流。返回 (方向, 涨跌 %) 或 None。"""
+        if not PRICE_EVENT_ENABLED or not price:
+            return None
+        with self._lock:
+            self.stats["ticks"] += 1
+            w = self._windows.setdefault(sym, MonotonicWindow(PRICE_EVENT_WINDOW_MIN * 60))
+            w.push(ts, price)
+            up, down = (price / w.min() - 1) * 100, (price / w.max() - 1) * 100
+            if up >= PRICE_EVENT_MOVE_PCT:
+                event = ("UP", up)
+            elif -down >= PRICE_EVENT_MOVE_PCT:
+                event = ("DOWN", down)
+            else:
+                return None
+            last = self._last_fired.get((sym, event[0]))
+            if last is not None and ts - last < PRICE_EVENT_COOLDOWN_MIN * 60:
+                return None
+            self._last_fired[(sym, event[0])] = ts
+            if full_check_pending(PRICE_EVENT_WINDOW_MIN * 60):
+                self.stats["suppressed"] += 1
+                return None
+            self.stats["events"] += 1
+        self._executor.submit(handle_price_event, sym, event[0], event[1], price)
+        return event
+
+def full_check_pending(window_sec) -> bool:
+    """完整检测正在运行、已排队，或 window_sec 内由价格波动触发过。"""
+    if _check_lock.locked() or time.time() - get_price_watch().last_trigger < window_sec:
+        return True
+    try:
+        return get_scheduler().get_job("triggered_check") is not None
+    except Exception:
+        return False
+
+@st.cache_resource
+def get_price_rules() -> PriceRuleEngine:
+    return PriceRuleEngine()
+
+def handle_price_event(sym, direction, pct, price):
+    """
+    价格异动：重新抓取该资产的链上指标（通常命中响应缓存）并评分；评分不写入历史，
+    以免改变定时检测的统计窗口。结果同样经过告警状态机，状态变化会一并写入通知。
+    """
+    cg_id = ASSETS[sym]
+    metrics = fetch_all_metrics([sym])[sym]
+    scores, zmat = score_assets([cg_id], [metrics])
+    rec = {"time": now_utc_str(), "symbol": sym, "price": price, "price_change_24h_pct": None,
+           "score": float(scores[0]), "metrics": metrics, "z": {k: float(zmat[0, j]) for j, k in enumerate(METRIC_NAMES)}}
+    if price_stream_active():
+        live = get_price_stream().latest(sym)
+        if live is not None:
+            rec["price_change_24h_pct"] = live["price_change_24h_pct"]
+    transitions = update_alert_states([rec])
+    title = f"⚡ {sym} {PRICE_EVENT_WINDOW_MIN:g} 分钟内{'急涨' if direction == 'UP' else '急跌'} {abs(pct):.1f}%"
+    lines = [title, f"时间: {rec['time']}", f"当前价格（USD）: {price}",
+             f"窗口内涨跌 (%): {pct:+.2f}（阈值 ±{PRICE_EVENT_MOVE_PCT:g}%）",
+             f"即时 Overheat Score: {rec['score']:.1f}", ""]
+    for tag, trec in transitions:
+        lines.append("=" * 24)
+        lines.extend(render_alert_section(tag, trec))
+        lines.append("")
+    if not transitions:
+        lines.append("贡献度（z-score）:")
+        lines.extend(f"  - {k}: {zval:+.3f}" for k, zval in rec["z"].items())
+    get_notifier().enqueue(title, "\n".join(lines))
+    return rec
+
+# --------------------
+# 调度器（两级：慢速完整检测 + 快速价格轮询，各自一个 APScheduler 任务）
+# --------------------
+_check_lock = threading.Lock()
+
+def run_check_job():
+    """定时 / 触发的完整检测入口；上一次尚未结束时跳过，避免重复抓取与通知。"""
+    if not _check_lock.acquire(blocking=False):
+        return None
+    try:
+        return single_check()
+    finally:
+        _check_lock.release()
+
+class PriceWatch:
+    """
+    记录上次完整检测时的参考价格，快速轮询据此判断是否出现大幅波动。
+    启动后尚未完成完整检测时，以首次轮询到的价格作为参考价，快速层不必等待第一次定时检测。
+    """
+    def __init__(self):
+        self.ref = {}
+        self.last_check = 0.0
+        self.last_trigger = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"polls": 0, "triggers": 0}
+
+    def mark_check(self, prices):
+        with self._lock:
+            self.ref = {a: p["price"] for a, p in prices.items() if p.get("price")}
+            self.last_check = time.time()
+
+    def observe(self, prices) -> List[tuple]:
+        """返回 [(asset_id, 相对参考价的涨跌 %)] 中超过阈值的项；满足触发间隔时记为一次触发。"""
+        with self._lock:
+            self.stats["polls"] += 1
+            moved = []
+            for a, p in prices.items():
+                if not p.get("price"):
+                    continue
+                ref = self.ref.setdefault(a, p["price"])
+                pct = (p["price"] / ref - 1.0) * 100
+                if abs(pct) >= PRICE_MOVE_TRIGGER_PCT:
+                    moved.append((a, pct))
+            if not moved or time.time() - max(self.last_trigger, self.last_check) < MIN_TRIGGER_GAP_MIN * 60:
+                return []
+            self.last_trigger = time.time()
+            self.stats["triggers"] += 1
+            return moved
+
+@st.cache_resource
+def get_price_watch() -> PriceWatch:
+    return PriceWatch()
+
+def price_tick():
+    """快速层：一次批量价格请求（启用价格流时直接读内存表）；大幅波动时立即调度一次完整检测（昂贵的 Glassnode 层）。"""
+    prices = current_prices()
+    # 先判断是否触发完整检测：触发时事件规则只更新窗口、不再单独推送异动通知
+    moved = get_price_watch().observe(prices)
+    if moved:
+        get_scheduler().add_job(run_check_job, id="triggered_check", replace_existing=True)
+    if not price_stream_active():
+        # 未启用价格流时，由轮询结果驱动事件规则（启用时规则直接挂在价格流上）
+        for sym, cg_id in ASSETS.items():
+            get_price_rules().on_tick(sym, time.time(), prices.get(cg_id, {}).get("price"))
+
+@st.cache_resource
+def get_scheduler() -> BackgroundScheduler:
+    # cache_resource：多个浏览器会话 / 脚本重跑共用一个调度器，不会重复启动
+    scheduler = BackgroundScheduler()
+    atexit.register(lambda: scheduler.shutdown(wait=False) if scheduler.running else None)
+    return scheduler
+
+def start_scheduler():
+    scheduler = get_scheduler()
+    scheduler.add_job(run_check_job, 'interval', minutes=CHECK_INTERVAL_MIN, id="crypto_overheat_job",
+                      replace_existing=True, max_instances=1, coalesce=True)
+    if PRICE_POLL_SEC > 0:
+        scheduler.add_job(price_tick, 'interval', seconds=PRICE_POLL_SEC, id="price_poll_job",
+                          replace_existing=True, max_instances=1, coalesce=True)
+    if not scheduler.running:
+        scheduler.start()
 
 # --------------------
 # Streamlit UI（简洁中文）
 # --------------------
-st.set_page_config(page_title="BTC/ETH 市场情绪监控器", layout="wide")
-st.title("BTC/ETH 市场情绪监控器")
-st.markdown("固定每 **3 小时** 自动检测（若需立刻检测请使用“手动检测”按钮）。<br>当检测到**过热**或**超跌**时，将同时发送 **简洁邮件标题 + 详细邮件正文**，并通过 Server酱 推送微信。", unsafe_allow_html=True)
-
-col_left, col_right = st.columns([3,1])
-
-with col_right:
-    st.subheader("运行信息")
-    st.markdown(f"- 检测间隔（固定）： **{FIXED_INTERVAL_MIN} 分钟（3 小时）**")
-    st.markdown(f"- 当前过热阈值： **{OVERHEAT_THRESHOLD}**")
-    st.markdown(f"- 当前超跌阈值： **{OVERSOLD_THRESHOLD}**")
-    st.markdown("---")
-    st.subheader("通知配置")
-    st.write("- 发件 Gmail（请在 Secrets 填写）")
-    st.write("- 收件邮箱（ALERT_EMAIL_TO）")
-    st.write("- ServerChan SendKey（SERVERCHAN_SENDKEY）")
-    st.write("- 可选：GLASSNODE_API_KEY（启用更丰富链上指标）")
-    st.markdown("---")
-    if st.button("手动检测一次（立即）"):
-        res = single_check()
-        st.success("手动检测已完成")
-        st.json(res)
-
-with col_left:
-    st.subheader("最近检测摘要")
-    # 读取上次运行记录
-    lr_path = os.path.join(HIST_DIR, "last_run.json")
-    if os.path.exists(lr_path):
+def render_ui():
+    st.set_page_config(page_title="BTC/ETH 市场情绪监控器", layout="wide")
+    st.title("BTC/ETH 市场情绪监控器")
+    st.markdown(f"每 **{CHECK_INTERVAL_MIN:g} 分钟** 自动检测，价格每 {PRICE_POLL_SEC:g} 秒轮询一次、波动超过 {PRICE_MOVE_TRIGGER_PCT:g}% 时提前检测（若需立刻检测请使用“手动检测”按钮）。<br>当检测到**过热**或**超跌**时，将同时发送 **简洁邮件标题 + 详细邮件正文**，并通过 Server酱 推送微信。", unsafe_allow_html=True)
+
+    col_left, col_right = st.columns([3,1])
+
+    with col_right:
+        st.subheader("运行信息")
+        st.markdown(f"- 检测间隔： **{CHECK_INTERVAL_MIN:g} 分钟**")
+        pw = get_price_watch().stats
+        st.markdown(f"- 价格轮询： **{PRICE_POLL_SEC:g} 秒**（已轮询 {pw['polls']} 次，波动触发 {pw['triggers']} 次）" if PRICE_POLL_SEC > 0 else "- 价格轮询：已关闭")
+        st.markdown(f"- 当前过热阈值： **{OVERHEAT_THRESHOLD}**")
+        st.markdown(f"- 当前超跌阈值： **{OVERSOLD_THRESHOLD}**")
+        hs = get_http().connection_stats()
+        st.markdown(f"- HTTP：请求 {hs['requests']} / 重试 {hs['retries']} / 新建连接 {hs['connections_opened']} / 复用 {hs['connections_reused']}")
+        for name, ls in get_http().limiter_stats().items():
+            st.markdown(f"- 限流 {name}：请求 {ls['acquired']} / 排队 {ls['waits']} 次，共等待 {ls['wait_sec']:.1f}s / 超时 {ls['timeouts']} 次")
+        if price_stream_active():
+            ps = get_price_stream().stats
+            st.markdown(f"- 实时价格流：{'已连接' if ps['connected'] else '未连接'} / 消息 {ps['messages']} / 重连 {ps['reconnects']}")
+        if PRICE_EVENT_ENABLED:
+            rs = get_price_rules().stats
+            st.markdown(f"- 价格异动规则：{PRICE_EVENT_WINDOW_MIN:g} 分钟内 ±{PRICE_EVENT_MOVE_PCT:g}%（报价 {rs['ticks']} / 触发 {rs['events']} / 并入完整检测 {rs['suppressed']}）")
+        cs = get_cache().stats
+        st.markdown(f"- 响应缓存：命中 {cs['hits']}（磁盘 {cs['disk_hits']}）/ 未命中 {cs['misses']} / 304 复用 {cs['not_modified']}")
+        ns = get_notifier().stats
+        st.markdown(f"- 通知队列：待发送 {get_notifier().pending_count()} / 已送达 {ns['delivered']} / 重试 {ns['retries']} / 放弃 {ns['failed']}")
+        st.markdown("---")
+        st.subheader("通知配置")
+        st.write("- 发件 Gmail（请在 Secrets 填写）")
+        st.write("- 收件邮箱（ALERT_EMAIL_TO）")
+        st.write("- ServerChan SendKey（SERVERCHAN_SENDKEY）")
+        st.write("- 可选：GLASSNODE_API_KEY（启用更丰富链上指标）")
+        st.markdown("---")
+        if st.button("手动检测一次（立即）"):
+            res = run_check_job()
+            if res is None:
+                st.info("后台检测正在进行，请稍后刷新查看结果。")
+            else:
+                st.success("手动检测已完成")
+                st.json(res)
+        if st.button("回填历史数据（Glassnode）"):
+            logs = []
+            backfill_history(log=logs.append)
+            st.success("历史回填完成")
+            st.text("\n".join(logs))
+
+    with col_left:
+        st.subheader("最近检测摘要")
+        # 读取上次运行记录
+        lr_path = os.path.join(HIST_DIR, "last_run.json")
+        if os.path.exists(lr_path):
+            try:
+                with open(lr_path, "r") as f:
+                    last = json.load(f)
+                st.markdown(f"**上次运行时间：** {last.get('time')}")
+                for rec in last.get("results", []):
+                    st.metric(label=f"{rec['symbol']} Overheat Score", value=f"{rec['score']:.1f}")
+                    st.write(f"- 价格: {rec.get('price')} USD")
+                    st.write(f"- 24h 变动: {rec.get('price_change_24h_pct')}")
+                    st.write(f"- 关键指标快照: {rec.get('metrics')}")
+                    st.markdown("---")
+                if last.get("alerts"):
+                    st.warning("上次检测有资产处于告警区间（新触发或升级的告警已通过邮件/微信发送，冷却期内的重复告警不再推送）。")
+            except Exception as e:
+                st.error(f"读取上次记录失败: {e}")
+        else:
+            st.info(f"尚未有检测记录。请点击右侧「手动检测一次（立即）」或等待定时器首次运行（{CHECK_INTERVAL_MIN:g} 分钟内）。")
+
+    st.caption("提示：若未配置 GLASSNODE_API_KEY，则链上/ETF/衍生品相关指标将退化为占位值 0，建议配置以获得完整信号。")
+
+    # 启动调度器（仅在 app 首次加载或重启时启动一次）
+    if "scheduler_started" not in st.session_state:
         try:
-            with open(lr_path, "r") as f:
-                last = json.load(f)
-            st.markdown(f"**上次运行时间：** {last.get('time')}")
-            for rec in last.get("results", []):
-                st.metric(label=f"{rec['symbol']} Overheat Score", value=f"{rec['score']:.1f}")
-                st.write(f"- 价格: {rec.get('price')} USD")
-                st.write(f"- 24h 变动: {rec.get('price_change_24h_pct')}")
-                st.write(f"- 关键指标快照: {rec.get('metrics')}")
-                st.markdown("---")
-            if last.get("alerts"):
-                st.warning("上次检测触发了告警（详情已通过邮件/微信发送）。")
+            get_notifier().start()
+            if price_stream_active():
+                get_price_stream().start()
+            start_scheduler()
+            st.session_state["scheduler_started"] = True
+            st.success(f"监控已启动（每 {CHECK_INTERVAL_MIN:g} 分钟检测一次）。")
         except Exception as e:
-            st.error(f"读取上次记录失败: {e}")
-    else:
-        st.info("尚未有检测记录。请点击右侧「手动检测一次（立即）」或等待定时器首次运行（3 小时内）。")
-
-st.caption("提示：若未配置 GLASSNODE_API_KEY，则链上/ETF/衍生品相关指标将退化为占位值 0，建议配置以获得完整信号。")
+            st.error(f"调度器启动失败：{e}")
 
-# 启动调度器（仅在 app 首次加载或重启时启动一次）
-if "scheduler_started" not in st.session_state:
-    try:
-        start_scheduler()
-        st.session_state["scheduler_started"] = True
-        st.success(f"监控已启动（每 {FIXED_INTERVAL_MIN} 分钟检测一次）。")
-    except Exception as e:
-        st.error(f"调度器启动失败：{e}")
+if __name__ == "__main__":
+    # `streamlit run app.py` 同样以 __main__ 执行；带子命令时走命令行工具
+    if len(sys.argv) > 1:
+        sys.exit(cli(sys.argv[1:]))
+    render_ui()
@@ -0,0 +1,213 @@
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("METRICS_CONFIG_PATH", os.path.join(ROOT, "metrics.json"))
+os.environ["CACHE_DISK_ENABLED"] = "false"
+os.environ.setdefault("NO_PROXY", "127.0.0.1,localhost")
+# app 在导入时创建相对路径的历史目录，测试在临时目录中导入，不污染仓库
+os.chdir(tempfile.mkdtemp(prefix="overheat-test-"))
+
+import app as _app  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """每个测试使用独立的历史目录（含告警状态、通知发件箱、响应缓存路径）与内存响应缓存。"""
+    monkeypatch.setattr(_app, "HIST_DIR", str(tmp_path))
+    monkeypatch.setattr(_app, "ALERT_STATE_PATH", str(tmp_path / "alert_state.json"))
+    monkeypatch.setattr(_app, "OUTBOX_DIR", str(tmp_path / "outbox"))
+    monkeypatch.setattr(_app, "CACHE_DIR", str(tmp_path / "http_cache"))
+    cache = _app.ResponseCache(disk_dir=None)
+    monkeypatch.setattr(_app, "get_cache", lambda: cache)
+    return _app
+
+
+class GlassnodeFixture:
+    """本地 Glassnode 替身：series[(metric 路径, 资产)] = [(t, v), ...]，按 s / u 过滤，记录每个请求（含 /bulk）。"""
+
+    def __init__(self):
+        self.series = {}
+        self.bulk_missing = set()   # bulk 响应中省略的资产（模拟部分覆盖）
+        self.bulk_status = 200      # 非 200 时 /bulk 直接返回该状态码（模拟套餐不支持）
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def handle(self, path, query):
+        metric = path.split("/v1/metrics/", 1)[1]
+        params = {k: v[-1] for k, v in query.items()}
+        with self._lock:
+            self.requests.append((metric, params))
+        s = float(params.get("s", "-inf"))
+        u = float(params.get("u", "inf"))
+        if metric.endswith("/bulk"):
+            # bulk：a 可重复，按时间聚合为 {"data": [{"t", "bulk": [{"a", "v"}]}]}
+            rows = {}
+            for sym in set(query.get("a", [])) - self.bulk_missing:
+                for t, v in self.series.get((metric[:-len("/bulk")], sym), []):
+                    if s <= t <= u:
+                        rows.setdefault(int(t), []).append({"a": sym, "v": v})
+            return {"data": [{"t": t, "bulk": rows[t]} for t in sorted(rows)]}
+        pts = self.series.get((metric, params.get("a")), [])
+        return [{"t": int(t), "v": v} for t, v in pts if s <= t <= u]
+
+
+@pytest.fixture
+def glassnode(app, monkeypatch):
+    fixture = GlassnodeFixture()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            payload = fixture.handle(parts.path, parse_qs(parts.query))
+            status = fixture.bulk_status if parts.path.endswith("/bulk") else 200
+            body = json.dumps(payload if status == 200 else {"message": "forbidden"}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(app, "GLASSNODE_BASE", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setattr(app, "GLASSNODE_API_KEY", "test-key")
+    monkeypatch.setattr(app, "_glassnode_bulk_unsupported", threading.Event())
+    yield fixture
+    server.shutdown()
+    server.server_close()
+
+
+class ReplayServer:
+    """
+    本地 WebSocket 回放服务（标准库实现，只发送未掩码的文本帧）：每个连接握手后按录制的事件间隔
+    （上限 1 秒）回放全部消息，然后保持连接直到客户端断开或 drop() / close()。
+    缺少 Sec-WebSocket-Key 的请求返回 400 并断开。
+    """
+    WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+    def __init__(self, path=None, messages=None, host="127.0.0.1", port=0):
+        if messages is None:
+            with open(path, "r") as f:
+                messages = [line.strip() for line in f if line.strip()]
+        self.messages = [(self._event_ts(raw), raw) for raw in messages]
+        self.requests = []          # 每次握手的请求路径（含订阅的 streams 参数）
+        self._conns = set()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._sock = socket.create_server((host, port))
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept, name="replay-server", daemon=True).start()
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/stream"
+
+    @staticmethod
+    def _event_ts(raw):
+        try:
+            msg = json.loads(raw)
+            return msg.get("data", msg)["E"] / 1000.0
+        except Exception:
+            return None
+
+    @staticmethod
+    def _frame(payload: bytes) -> bytes:
+        n = len(payload)
+        if n < 126:
+            header = struct.pack("!BB", 0x81, n)
+        elif n < 1 << 16:
+            header = struct.pack("!BBH", 0x81, 126, n)
+        else:
+            header = struct.pack("!BBQ", 0x81, 127, n)
+        return header + payload
+
+    def _accept(self):
+        while not self._closed.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._conns.add(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            req = b""
+            while b"\r\n\r\n" not in req:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    return
+                req += chunk
+            lines = req.decode("latin-1").split("\r\n")
+            headers = {k.strip().lower(): v.strip() for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)}
+            key = headers.get("sec-websocket-key")
+            if key is None:
+                conn.sendall(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+                return
+            accept = base64.b64encode(hashlib.sha1((key + self.WS_GUID).encode()).digest()).decode()
+            conn.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+            with self._lock:
+                self.requests.append(lines[0].split(" ")[1])
+            last = None
+            for event, raw in self.messages:
+                if event is not None and last is not None:
+                    time.sleep(min(max(event - last, 0.0), 1.0))
+                last = event if event is not None else last
+                conn.sendall(self._frame(raw.encode("utf-8")))
+            while conn.recv(4096):
+                pass   # 忽略客户端发来的帧，直到连接关闭
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._conns.discard(conn)
+            conn.close()
+
+    def drop(self):
+        """断开所有当前连接（模拟交易所断线），服务继续接受新连接。"""
+        with self._lock:
+            conns = list(self._conns)
+        for conn in conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        self._closed.set()
+        self._sock.close()
+        self.drop()
+
+
+@pytest.fixture
+def replay_server():
+    """replay_server(messages) 启动一个本地 WebSocket 回放服务，测试结束时关闭。"""
+    servers = []
+
+    def start(messages):
+        servers.append(ReplayServer(messages=messages))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,44 @@
+import pytest
+
+MIN = 60
+
+
+@pytest.fixture
+def alert_env(app, monkeypatch):
+    monkeypatch.setattr(app, "OVERHEAT_THRESHOLD", 60.0)
+    monkeypatch.setattr(app, "OVERSOLD_THRESHOLD", 30.0)
+    monkeypatch.setattr(app, "ALERT_HYSTERESIS", 5.0)
+    monkeypatch.setattr(app, "ALERT_COOLDOWN_MIN", 60.0)
+    monkeypatch.setattr(app, "ALERT_ESCALATION_STEP", 10.0)
+    return app
+
+
+# (tag, [(分钟, 分数, 期望返回)])
+CASES = {
+    "overheat_entry": ("OVERHEAT", [(0, 59, None), (1, 60, "new"), (2, 65, None)]),
+    "overheat_hysteresis": ("OVERHEAT", [(0, 62, "new"), (1, 56, None), (2, 54, None), (200, 61, "new")]),
+    "overheat_cooldown": ("OVERHEAT", [(0, 62, "new"), (10, 50, None), (20, 62, None), (30, 50, None), (90, 62, "new")]),
+    "overheat_escalation": ("OVERHEAT", [(0, 60, "new"), (1, 69, None), (2, 70, "escalated"), (3, 75, None), (4, 80, "escalated")]),
+    "oversold_entry": ("OVERSOLD", [(0, 31, None), (1, 30, "new"), (2, 34, None), (3, 36, None), (200, 29, "new")]),
+    "oversold_escalation": ("OVERSOLD", [(0, 28, "new"), (1, 19, None), (2, 18, "escalated")]),
+}
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_step_alert_state(alert_env, name):
+    tag, steps = CASES[name]
+    s = {}
+    for minute, score, expected in steps:
+        assert alert_env.step_alert_state(s, tag, score, minute * MIN) == expected, (minute, score)
+
+
+def test_update_alert_states_reports_kind_and_previous_score(alert_env):
+    rec = lambda score: {"symbol": "BTC", "score": score}
+    out = alert_env.update_alert_states([rec(25)], now=0)
+    assert [(tag, r["alert_kind"]) for tag, r in out] == [("OVERSOLD", "new")]
+    out = alert_env.update_alert_states([rec(14)], now=MIN)
+    assert [(tag, r["alert_kind"], r["prev_notified_score"]) for tag, r in out] == [("OVERSOLD", "escalated", 25)]
+    out = alert_env.update_alert_states([rec(65)], now=2 * MIN)
+    assert [(tag, r["alert_kind"]) for tag, r in out] == [("OVERHEAT", "new")]
+    # 状态持久化在（隔离的）ALERT_STATE_PATH
+    assert alert_env.load_alert_state()["BTC:OVERSOLD"]["active"] is False
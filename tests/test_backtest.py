@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+
+
+def test_rolling_zscores_match_reference_with_gaps(app):
+    rng = np.random.default_rng(3)
+    window = 12
+    x = rng.normal(5, 2, (80, 3))
+    x[rng.random(x.shape) < 0.25] = np.nan      # 零散缺失
+    x[20:35, 1] = np.nan                          # 连续缺失段
+    x[40:60, 2] = 7.0                             # 常数段（标准差为 0）
+    z = app.rolling_zscores(x, window)
+    for t in range(x.shape[0]):
+        for m in range(x.shape[1]):
+            if np.isnan(x[t, m]):
+                assert z[t, m] == 0.0
+                continue
+            past = x[max(t - window, 0):t, m]
+            ref = app.compute_zscore(x[t, m], past[~np.isnan(past)].tolist())
+            assert abs(z[t, m] - ref) < 1e-8, (t, m)
+
+
+def test_load_backtest_inputs_aligns_stored_history(app):
+    step = app.BACKTEST_STEP_SEC
+    t0 = 1_700_000_000 - 1_700_000_000 % step
+    for d in range(30):
+        app.append_hist("bitcoin", app.PRICE_SERIES, 100.0 + d, ts=t0 + d * step)
+        app.append_hist("bitcoin", app.METRIC_NAMES[0], float(d % 5), ts=t0 + d * step)
+    inputs = app.load_backtest_inputs(asset_ids=["bitcoin"], window_days=10)
+    assert inputs["z"].shape == (1, len(inputs["grid"]), len(app.METRIC_NAMES))
+    assert inputs["price"][0, -1] == 129.0
+    h1 = inputs["horizons"].index(1)
+    assert abs(inputs["fwd"][0, h1, 0] - (inputs["price"][0, 1] / inputs["price"][0, 0] - 1)) < 1e-12
+
+
+def test_cli_reports_missing_history_without_traceback(app, capsys):
+    assert app.cli(["backtest"]) == 1
+    err = capsys.readouterr().err
+    assert "没有价格历史" in err and "Traceback" not in err
+
+
+def test_split_holdout_purges_forward_returns_that_cross_the_split(app):
+    z = np.zeros((1, 20, len(app.METRIC_NAMES)))
+    fwd = np.arange(20, dtype=float)[None, :]
+    z_tr, fwd_tr, z_te, fwd_te = app.split_holdout(z, fwd, horizon_steps=3, holdout_frac=0.25)
+    assert z_tr.shape[1] == 15 and z_te.shape[1] == 5
+    assert np.isnan(fwd_tr[0, 12:]).all() and not np.isnan(fwd_tr[0, :12]).any()
+    assert fwd_te[0].tolist() == [15, 16, 17, 18, 19]
+
+
+def test_optimizer_does_not_write_when_holdout_fails(app, tmp_path, monkeypatch):
+    T = 400
+    z = np.zeros((1, T, len(app.METRIC_NAMES)))
+    z[0, :, 0] = np.tile([3.0, -3.0], T // 2)
+    # 训练区间内分数高时随后下跌、分数低时随后上涨；样本外区间反过来
+    sign = np.where(np.arange(T) < 300, 1.0, -1.0)
+    fwd = (-np.sign(z[0, :, 0]) * sign * 0.01)[None, None, :]
+    monkeypatch.setattr(app, "load_backtest_inputs", lambda **kw: {"z": z, "fwd": fwd})
+    out = tmp_path / "score.json"
+    best = app.optimize_score_params(samples=16, workers=1, output=str(out), log=lambda *a: None)
+    assert best["objective"] > 0 and best["holdout"]["objective"] < 0
+    assert not out.exists()
+    # 样本外同样有效时写入，并记录样本外指标
+    monkeypatch.setattr(app, "load_backtest_inputs", lambda **kw: {"z": z, "fwd": np.abs(fwd) * -np.sign(z[0, :, 0])})
+    app.optimize_score_params(samples=16, workers=1, output=str(out), log=lambda *a: None)
+    assert json.loads(out.read_text())["holdout"]["objective"] > 0
@@ -0,0 +1,33 @@
+import time
+
+
+def recent(value):
+    now = int(time.time())
+    return [(now - now % 86400 - 86400, value - 1), (now - now % 86400, value)]
+
+
+def test_bulk_request_covers_all_assets(app, glassnode):
+    glassnode.series[("m", "BTC")] = recent(10.0)
+    glassnode.series[("m", "ETH")] = recent(20.0)
+    assert app.glassnode_bulk_latest("m", ["BTC", "ETH"]) == {"BTC": 10.0, "ETH": 20.0}
+    assert [metric for metric, _ in glassnode.requests] == ["m/bulk"]
+
+
+def test_assets_missing_from_bulk_are_fetched_individually(app, glassnode):
+    glassnode.series[("m", "BTC")] = recent(10.0)
+    glassnode.series[("m", "ETH")] = recent(20.0)
+    glassnode.bulk_missing = {"ETH"}
+    assert app.glassnode_bulk_latest("m", ["BTC", "ETH"]) == {"BTC": 10.0, "ETH": 20.0}
+    assert [metric for metric, _ in glassnode.requests] == ["m/bulk", "m"]
+    assert glassnode.requests[1][1]["a"] == "ETH"
+
+
+def test_bulk_rejection_switches_later_cycles_to_per_asset(app, glassnode):
+    glassnode.series[("m", "BTC")] = recent(10.0)
+    glassnode.series[("m", "ETH")] = recent(20.0)
+    glassnode.bulk_status = 403
+    assert app.glassnode_bulk_latest("m", ["BTC", "ETH"]) == {"BTC": 10.0, "ETH": 20.0}
+    assert [metric for metric, _ in glassnode.requests] == ["m/bulk", "m", "m"]
+    glassnode.requests.clear()
+    assert app.glassnode_bulk_latest("m", ["BTC", "ETH"], ttl=0) == {"BTC": 10.0, "ETH": 20.0}
+    assert [metric for metric, _ in glassnode.requests] == ["m", "m"]
@@ -0,0 +1,61 @@
+import os
+import threading
+
+import pytest
+
+
+def crash_on_second_replace(app, monkeypatch):
+    real, calls = os.replace, []
+
+    def flaky(src, dst):
+        calls.append(dst)
+        if len(calls) == 2:
+            raise KeyboardInterrupt("simulated crash")
+        return real(src, dst)
+
+    monkeypatch.setattr(app.os, "replace", flaky)
+    return real
+
+
+def test_rewrite_interrupted_after_commit_rolls_forward(app, monkeypatch):
+    app.merge_hist("a", "m", [(1.0, 10.0), (2.0, 20.0)])
+    real = crash_on_second_replace(app, monkeypatch)
+    with pytest.raises(KeyboardInterrupt):
+        app.merge_hist("a", "m", [(3.0, 30.0)])     # .val 已换入，.ts 尚未换入
+    monkeypatch.setattr(app.os, "replace", real)
+    assert app.query_hist("a", "m") == ([1.0, 2.0, 3.0], [10.0, 20.0, 30.0])
+    assert not os.path.exists(app.hist_path("a", "m", "commit"))
+
+
+def test_rewrite_interrupted_before_commit_keeps_old_version(app, monkeypatch):
+    app.merge_hist("a", "m", [(1.0, 10.0), (2.0, 20.0)])
+    real = os.fsync
+    monkeypatch.setattr(app.os, "fsync", lambda fd: (_ for _ in ()).throw(KeyboardInterrupt()))
+    with pytest.raises(KeyboardInterrupt):
+        app.merge_hist("a", "m", [(3.0, 30.0)])     # 提交标记之前中断
+    monkeypatch.setattr(app.os, "fsync", real)
+    assert app.query_hist("a", "m") == ([1.0, 2.0], [10.0, 20.0])
+    app.append_hist("a", "m", 40.0, ts=4.0)
+    assert app.query_hist("a", "m") == ([1.0, 2.0, 4.0], [10.0, 20.0, 40.0])
+    assert not os.path.exists(app.hist_path("a", "m", "val") + ".tmp")
+
+
+def test_concurrent_append_and_merge_lose_nothing(app):
+    app.merge_hist("a", "m", [(float(t), float(t)) for t in range(100)])
+
+    def appender():
+        for i in range(200):
+            app.append_hist("a", "m", 1000.0 + i, ts=1000.0 + i)
+
+    def merger():
+        for i in range(20):
+            app.merge_hist("a", "m", [(100.0 + i, 100.0 + i)])
+
+    threads = [threading.Thread(target=appender), threading.Thread(target=merger)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ts, vals = app.query_hist("a", "m")
+    assert set(range(100)) | set(range(100, 120)) | set(range(1000, 1200)) == set(ts)
+    assert ts == vals
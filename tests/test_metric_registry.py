@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+
+def write(tmp_path, metrics):
+    p = tmp_path / "metrics.json"
+    p.write_text(json.dumps({"metrics": metrics}))
+    return str(p)
+
+
+GOOD = {"name": "funding_rate", "fetcher": "glassnode", "path": "derivatives/FuturesFundingRatePerpetual", "weight": 0.1}
+PCT = {"name": "oi_change_pct", "fetcher": "glassnode_pct_change", "path": "derivatives/FuturesOpenInterestSum",
+       "series": "src_open_interest", "window_days": 7, "window_secret": "TEST_OI_WINDOW_DAYS", "weight": 0.15}
+
+
+def test_shipped_registry_drives_weights(app):
+    registry = app.load_metric_registry()
+    assert [s["name"] for s in registry] == app.METRIC_NAMES
+    assert app.METRIC_WEIGHTS["reserve_change_pct"] < 0
+
+
+def test_window_secret_overrides_window_days(app, tmp_path, monkeypatch):
+    monkeypatch.setenv("TEST_OI_WINDOW_DAYS", "14")
+    (spec,) = app.load_metric_registry(write(tmp_path, [PCT]))
+    assert spec["window_days"] == 14.0
+
+
+@pytest.mark.parametrize("metrics, message", [
+    ([{**GOOD, "weight": None}], "weight"),
+    ([{"name": "whales", "fetcher": "whale_count", "weight": 0.1}], "thresholds"),
+    ([{**GOOD, "name": "price"}], "价格序列"),
+    ([GOOD, {**PCT, "series": "funding_rate"}], "原始序列名"),
+    ([{**PCT, "series": "price"}], "原始序列名"),
+    ([GOOD, GOOD], "重复"),
+    ([{**GOOD, "fetcher": "bogus"}], "fetcher"),
+])
+def test_invalid_entries_fail_at_load(app, tmp_path, metrics, message):
+    with pytest.raises(ValueError, match=message):
+        app.load_metric_registry(write(tmp_path, metrics))
@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+
+class FakeGmail:
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def notify_env(app, monkeypatch):
+    """只保留一个记录投递次数的渠道。"""
+    sent, lock = Counter(), threading.Lock()
+
+    def send(m):
+        with lock:
+            sent[m["id"]] += 1
+        return True
+
+    monkeypatch.setattr(app, "NOTIFY_CHANNELS", {"fake": (lambda: True, send)})
+    monkeypatch.setattr(app, "get_gmail", lambda: FakeGmail())
+    return sent
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_outbox_leftover_and_new_message_delivered_once(app, notify_env):
+    q = app.NotificationQueue()
+    leftover = {"id": "0-leftover", "title": "t", "body": "b", "pending": ["fake"], "attempts": 0, "next_try": 0}
+    with open(os.path.join(app.OUTBOX_DIR, "0-leftover.json"), "w") as f:
+        json.dump(leftover, f)
+    new_id = q.enqueue("t2", "b2")
+    wait_for(lambda: q.pending_count() == 0)
+    time.sleep(0.1)
+    assert notify_env == {"0-leftover": 1, new_id: 1}
+    assert q.stats["delivered"] == 2
+
+
+def test_worker_survives_exception_in_deliver(app, notify_env, monkeypatch):
+    q = app.NotificationQueue()
+    real, calls = q._deliver, []
+
+    def flaky(msg_id):
+        calls.append(msg_id)
+        if len(calls) <= app.NOTIFY_WORKERS:
+            raise RuntimeError("boom")
+        return real(msg_id)
+
+    monkeypatch.setattr(q, "_deliver", flaky)
+    first = [q.enqueue(f"t{i}", "b") for i in range(app.NOTIFY_WORKERS)]
+    wait_for(lambda: len(calls) == app.NOTIFY_WORKERS and not q._inflight)
+    second = q.enqueue("after", "b")
+    wait_for(lambda: notify_env[second] == 1)
+    # 抛异常的通知仍留在 outbox，等待下次启动重新排期
+    assert all(os.path.exists(q._path(m)) for m in first)
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.jobs = {}
+
+    def add_job(self, fn, id=None, **kwargs):
+        self.jobs[id] = fn
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+
+
+@pytest.fixture
+def price_env(app, monkeypatch):
+    """价格轮询环境：参考价 100，价格流关闭，事件处理与调度器均为替身。"""
+    watch, rules, scheduler = app.PriceWatch(), app.PriceRuleEngine(), FakeScheduler()
+    watch.mark_check({cg_id: {"price": 100.0} for cg_id in app.ASSETS.values()})
+    watch.last_check = 0.0
+    events, done = [], threading.Event()
+
+    def fake_event(sym, direction, pct, price):
+        events.append((sym, direction))
+        done.set()
+
+    prices = {cg_id: {"price": 100.0, "price_change_24h_pct": 0.0} for cg_id in app.ASSETS.values()}
+    monkeypatch.setattr(app, "PRICE_STREAM_ENABLED", False)
+    monkeypatch.setattr(app, "PRICE_EVENT_ENABLED", True)
+    monkeypatch.setattr(app, "get_price_watch", lambda: watch)
+    monkeypatch.setattr(app, "get_price_rules", lambda: rules)
+    monkeypatch.setattr(app, "get_scheduler", lambda: scheduler)
+    monkeypatch.setattr(app, "handle_price_event", fake_event)
+    monkeypatch.setattr(app, "current_prices", lambda: {k: dict(v) for k, v in prices.items()})
+    return {"prices": prices, "events": events, "done": done, "scheduler": scheduler, "rules": rules}
+
+
+def test_triggered_full_check_suppresses_event_notification(app, price_env):
+    app.price_tick()
+    price_env["prices"]["bitcoin"]["price"] = 105.0
+    app.price_tick()
+    assert "triggered_check" in price_env["scheduler"].jobs
+    assert price_env["rules"].stats["suppressed"] == 1
+    assert not price_env["done"].wait(0.2)
+    assert price_env["events"] == []
+
+
+def test_event_fires_when_no_full_check_is_triggered(app, price_env, monkeypatch):
+    monkeypatch.setattr(app, "PRICE_MOVE_TRIGGER_PCT", 50.0)
+    app.price_tick()
+    price_env["prices"]["bitcoin"]["price"] = 105.0
+    app.price_tick()
+    assert price_env["scheduler"].jobs == {}
+    assert price_env["done"].wait(2)
+    assert price_env["events"] == [("BTC", "UP")]
+    assert price_env["rules"].stats["events"] == 1
+
+
+def test_fast_tier_seeds_reference_before_first_full_check(app):
+    watch = app.PriceWatch()
+    assert watch.observe({"bitcoin": {"price": 100.0}}) == []
+    assert watch.ref == {"bitcoin": 100.0}
+    moved = watch.observe({"bitcoin": {"price": 104.0}})
+    assert [a for a, _ in moved] == ["bitcoin"]
+    assert watch.stats["triggers"] == 1
+
+
+def test_single_check_does_not_wait_past_deadline_for_prices(app, monkeypatch):
+    release = threading.Event()
+
+    def stuck_prices():
+        release.wait(5)
+        return {}
+
+    monkeypatch.setattr(app, "FETCH_DEADLINE_SEC", 0.2)
+    monkeypatch.setattr(app, "current_prices", stuck_prices)
+    monkeypatch.setattr(app, "fetch_all_metrics", lambda syms: {s: {n: 0.0 for n in app.METRIC_NAMES} for s in syms})
+    monkeypatch.setattr(app, "get_price_watch", lambda: app.PriceWatch())
+    monkeypatch.setattr(app, "dispatch_alerts", lambda *a, **k: None)
+    started = time.monotonic()
+    try:
+        out = app.single_check()
+    finally:
+        release.set()
+    assert time.monotonic() - started < 2
+    assert all(r["price"] is None for r in out["results"])
@@ -0,0 +1,80 @@
+import json
+import socket
+import time
+
+import pytest
+
+
+def ticker(sym, price, pct=1.0, event_ms=1_700_000_000_000):
+    data = {"e": "24hrTicker", "E": event_ms, "s": f"{sym}USDT", "c": str(price), "P": str(pct)}
+    return json.dumps({"stream": f"{sym.lower()}usdt@ticker", "data": data})
+
+
+def wait_until(pred, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if pred():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def replay(replay_server):
+    return replay_server([ticker("BTC", 65000.0, 2.5), ticker("ETH", 3200.0, -1.0)])
+
+
+@pytest.fixture
+def stream(app, replay):
+    s = app.PriceStream(["BTC", "ETH"], url=replay.url)
+    s.start()
+    yield s
+    s.stop()
+
+
+def test_connects_subscribes_and_fills_table(stream, replay):
+    assert wait_until(lambda: stream.stats["messages"] == 2)
+    assert replay.requests == ["/stream?streams=btcusdt@ticker/ethusdt@ticker"]
+    assert stream.stats["connected"]
+    assert stream.latest("BTC")["price"] == 65000.0
+    assert stream.latest("ETH")["price_change_24h_pct"] == -1.0
+
+
+def test_reconnects_and_resubscribes_after_drop(stream, replay):
+    assert wait_until(lambda: stream.stats["messages"] == 2)
+    replay.drop()
+    assert wait_until(lambda: stream.stats["messages"] == 4)
+    assert stream.stats["reconnects"] >= 1
+    assert len(replay.requests) == 2
+    assert replay.requests[1] == replay.requests[0]
+    assert stream.stats["connected"]
+
+
+def test_current_prices_falls_back_for_stale_quotes(app, stream, monkeypatch):
+    assert wait_until(lambda: stream.stats["messages"] == 2)
+    requested = []
+
+    def fake_coingecko(ids):
+        requested.append(list(ids))
+        return {i: {"price": 1.0, "price_change_24h_pct": 0.0} for i in ids}
+
+    monkeypatch.setattr(app, "PRICE_STREAM_ENABLED", True)
+    monkeypatch.setattr(app, "get_price_stream", lambda: stream)
+    monkeypatch.setattr(app, "fetch_prices_coingecko", fake_coingecko)
+
+    prices = app.current_prices()
+    assert requested == []
+    assert prices["bitcoin"]["price"] == 65000.0
+
+    stream.table["BTC"]["recv_ts"] -= app.PRICE_STREAM_STALE_SEC + 1
+    prices = app.current_prices()
+    assert requested == [["bitcoin"]]
+    assert prices["bitcoin"]["price"] == 1.0
+    assert prices["ethereum"]["price"] == 3200.0
+
+
+def test_replay_server_rejects_handshake_without_key(replay):
+    with socket.create_connection(("127.0.0.1", replay.port), timeout=5) as conn:
+        conn.sendall(b"GET /stream HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\n\r\n")
+        assert conn.recv(4096).startswith(b"HTTP/1.1 400")
+    assert replay.requests == []
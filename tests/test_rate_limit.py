@@ -0,0 +1,21 @@
+import time
+
+import pytest
+
+
+def test_acquire_raises_instead_of_waiting_past_max_wait(app):
+    bucket = app.TokenBucket(per_min=60, capacity=1)
+    assert bucket.acquire(max_wait=0.5) == 0.0
+    t0 = time.monotonic()
+    with pytest.raises(app.RateLimitTimeout):
+        bucket.acquire(max_wait=0.5)     # 下一个令牌约 1 秒后才产生
+    assert time.monotonic() - t0 < 0.2
+    assert bucket.stats["timeouts"] == 1
+
+
+def test_long_retry_after_is_clamped_and_fails_fast(app):
+    bucket = app.TokenBucket(per_min=6000, capacity=10)
+    bucket.pause(3600)
+    assert bucket.blocked_until - time.monotonic() <= app.HTTP_RETRY_AFTER_MAX
+    with pytest.raises(app.RateLimitTimeout):
+        bucket.acquire(max_wait=1.0)
@@ -0,0 +1,27 @@
+import os
+import time
+
+
+def test_disk_tier_is_capped_by_least_recent_use(app, tmp_path):
+    disk = tmp_path / "http_cache"
+    cache = app.ResponseCache(max_entries=2, disk_dir=str(disk), disk_max_entries=3)
+    for i in range(3):
+        cache.put(f"k{i}", {"i": i}, ttl=60)
+        os.utime(disk / f"k{i}.json", (time.time() - 100 + i, time.time() - 100 + i))
+    assert cache.get("k0") == {"i": 0}     # 磁盘命中刷新 mtime
+    cache.put("k3", {"i": 3}, ttl=60)
+    cache.prune_disk()
+    assert sorted(p.name for p in disk.iterdir()) == ["k0.json", "k2.json", "k3.json"]
+    assert cache.stats["disk_evicted"] == 1
+
+
+def test_range_requests_with_end_param_are_not_cached(app, glassnode):
+    glassnode.series[("m", "BTC")] = [(100, 1.0), (200, 2.0)]
+    for _ in range(2):
+        assert app.glassnode_series("m", "BTC", since=0, until=300) == [(100.0, 1.0), (200.0, 2.0)]
+    assert len(glassnode.requests) == 2
+    cache = app.get_cache()
+    assert cache.stats["hits"] == 0 and cache.stats["misses"] == 0
+    assert app.glassnode_try("m", "BTC") == 2.0
+    assert app.glassnode_try("m", "BTC") == 2.0
+    assert len(glassnode.requests) == 3
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def make_inputs(app, seed=7):
+    """两资产 × 全部指标：历史长度不一（含不足 2 条与常数序列），当前值随机。"""
+    rng = np.random.default_rng(seed)
+    names = app.METRIC_NAMES
+    metrics, hists = [], []
+    for a in range(2):
+        m, h = {}, {}
+        for j, k in enumerate(names):
+            n = [0, 1, 5, 30, 60, 90][(a + j) % 6]
+            h[k] = [3.0] * n if (a, j) == (1, 2) else rng.normal(j, 1 + j, n).tolist()
+            m[k] = float(rng.normal(j, 2 + j))
+        metrics.append(m)
+        hists.append(h)
+    return names, metrics, hists
+
+
+def test_vectorized_scores_match_reference(app):
+    names, metrics, hists = make_inputs(app)
+    width = max(len(v) for h in hists for v in h.values())
+    current = np.array([[m[k] for k in names] for m in metrics])
+    hist = np.full((len(metrics), len(names), width), np.nan)
+    for a, h in enumerate(hists):
+        for j, k in enumerate(names):
+            hist[a, j, :len(h[k])] = h[k]
+    scores, z = app.vectorized_overheat_scores(current, hist)
+    for a, (m, h) in enumerate(zip(metrics, hists)):
+        ref_score, ref_z = app.compute_overheat_score(m, h)
+        assert abs(scores[a] - ref_score) < 1e-9
+        assert np.allclose(z[a], [ref_z[k] for k in names], atol=1e-9)
+
+
+def test_score_assets_matches_reference_over_stored_history(app):
+    names, metrics, hists = make_inputs(app, seed=11)
+    now = 1_700_000_000.0
+    assets = ["parity-a", "parity-b"]
+    for asset, h in zip(assets, hists):
+        for k, vals in h.items():
+            for i, v in enumerate(vals):
+                app.append_hist(asset, k, v, ts=now - (len(vals) - i) * 3600)
+    scores, z = app.score_assets(assets, metrics, now=now)
+    for a, (m, h) in enumerate(zip(metrics, hists)):
+        ref_score, ref_z = app.compute_overheat_score(m, h)
+        assert abs(scores[a] - ref_score) < 1e-9
+        assert np.allclose(z[a], [ref_z[k] for k in names], atol=1e-9)
@@ -0,0 +1,54 @@
+DAY = 86400
+T0 = 1_700_000_000 - 1_700_000_000 % DAY
+PATH = "derivatives/FuturesOpenInterestSum"
+SERIES = "src_open_interest"
+
+
+def daily(start_day, end_day, value=lambda d: 100.0 + d):
+    return [(T0 + d * DAY, value(d)) for d in range(start_day, end_day + 1)]
+
+
+def test_first_sync_pulls_lookback_window(app, glassnode):
+    glassnode.series[(PATH, "BTC")] = daily(0, 60)
+    now = T0 + 60 * DAY + 60
+    added = app.sync_glassnode_series("BTC", PATH, SERIES, lookback_days=30, now=now)
+    assert len(glassnode.requests) == 1
+    metric, params = glassnode.requests[0]
+    assert metric == PATH
+    assert int(params["s"]) == int(now - 30 * DAY)
+    assert added == 30
+    ts, vals = app.query_hist("bitcoin", SERIES)
+    assert ts[0] == T0 + 31 * DAY and ts[-1] == T0 + 60 * DAY
+    assert vals[-1] == 160.0
+
+
+def test_follow_up_requests_only_the_tail(app, glassnode):
+    glassnode.series[(PATH, "BTC")] = daily(0, 60)
+    app.sync_glassnode_series("BTC", PATH, SERIES, lookback_days=30, now=T0 + 60 * DAY + 60)
+    glassnode.series[(PATH, "BTC")] = daily(0, 62)
+    added = app.sync_glassnode_series("BTC", PATH, SERIES, lookback_days=30, now=T0 + 62 * DAY + 60)
+    assert added == 2
+    assert len(glassnode.requests) == 2
+    assert int(glassnode.requests[1][1]["s"]) == T0 + 60 * DAY + 1
+    ts, _ = app.query_hist("bitcoin", SERIES)
+    assert ts[-2:] == [T0 + 61 * DAY, T0 + 62 * DAY]
+    assert len(ts) == len(set(ts))
+
+
+def test_skips_request_until_next_point_is_due(app, glassnode):
+    glassnode.series[(PATH, "BTC")] = daily(0, 60)
+    app.sync_glassnode_series("BTC", PATH, SERIES, lookback_days=30, now=T0 + 60 * DAY + 60)
+    assert app.sync_glassnode_series("BTC", PATH, SERIES, lookback_days=30, now=T0 + 60 * DAY + DAY - 1) == 0
+    assert len(glassnode.requests) == 1
+
+
+def test_series_pct_change_uses_as_of_base(app, glassnode):
+    glassnode.series[(PATH, "BTC")] = daily(0, 60)
+    app.sync_glassnode_series("BTC", PATH, SERIES, lookback_days=30, now=T0 + 60 * DAY + 60)
+    # 末点 160，7 天前 153
+    assert abs(app.series_pct_change("bitcoin", SERIES, 7) - (160 / 153 - 1) * 100) < 1e-9
+    # 非整天窗口取 as-of（<= 基准时刻的最近一点）：6.5 天前 -> 第 53 天
+    assert abs(app.series_pct_change("bitcoin", SERIES, 6.5) - (160 / 153 - 1) * 100) < 1e-9
+    # 窗口超出本地数据：0.0
+    assert app.series_pct_change("bitcoin", SERIES, 365) == 0.0
+    assert app.series_pct_change("bitcoin", "missing_series", 7) == 0.0